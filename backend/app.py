@@ -1,13 +1,18 @@
 import sys
 import os
+import atexit
+import json
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g, Response, stream_with_context
 from flask_cors import CORS
 from services.configuracion_service import ProcesadorConfiguracion
 from services.consumo_service import ProcesadorConsumo
 from services.facturacion_service import FacturacionService
 from database.xml_manager import XMLManager
+from database.sqlite_manager import SQLiteManager
+from database.persistencia_diferida import PersistenciaDiferida
 from utils.validators import validar_nit, extraer_fecha
+from utils.date_utils import es_rango_fecha_valido
 import re
 from services.reportes_service import ReportePDFService
 import base64
@@ -25,20 +30,118 @@ CORS(app)
 
 
 
+# Almacenamiento: 'xml' (archivos en data/) o 'sqlite' (data/nube.db). Para pasar
+# los XML existentes a SQLite: python migrar_a_sqlite.py
+ALMACENAMIENTO = os.environ.get('ALMACENAMIENTO', 'xml')
+RUTA_SQLITE = os.environ.get('RUTA_SQLITE', 'data/nube.db')
+# Modo bitácora: cada mutación se agrega a data/bitacora.log y un hilo en
+# segundo plano la consolida en los XML cada INTERVALO_COMPACTACION segundos
+# (solo con almacenamiento XML; SQLite ya guarda cada fila por separado)
+MODO_BITACORA = ALMACENAMIENTO == 'xml' and os.environ.get('MODO_BITACORA', '0') == '1'
+INTERVALO_COMPACTACION = int(os.environ.get('INTERVALO_COMPACTACION', '30'))
+# Carga paralela: cada XML se parsea en un proceso distinto al iniciar
+CARGA_PARALELA = os.environ.get('CARGA_PARALELA', '0') == '1'
+# Clientes particionados: con N > 0 se guardan en N archivos por hash del NIT y
+# un cambio en un cliente solo reescribe su partición
+PARTICIONES_CLIENTES = int(os.environ.get('PARTICIONES_CLIENTES', '0'))
+# Durabilidad del guardado: 'sincrona' guarda dentro de cada petición, 'agrupada'
+# junta los cambios y los guarda en segundo plano cada INTERVALO_GUARDADO_MS
+# milisegundos o cada MAX_CAMBIOS_GUARDADO mutaciones
+DURABILIDAD = os.environ.get('DURABILIDAD', 'sincrona')
+INTERVALO_GUARDADO_MS = int(os.environ.get('INTERVALO_GUARDADO_MS', '200'))
+MAX_CAMBIOS_GUARDADO = int(os.environ.get('MAX_CAMBIOS_GUARDADO', '100'))
+# Facturas por mes de emisión: los últimos MESES_FACTURAS_ACTIVOS meses se cargan al
+# iniciar; de los anteriores se guardan en memoria a lo sumo SEGMENTOS_FACTURAS_HISTORICOS
+MESES_FACTURAS_ACTIVOS = int(os.environ.get('MESES_FACTURAS_ACTIVOS', '3'))
+SEGMENTOS_FACTURAS_HISTORICOS = int(os.environ.get('SEGMENTOS_FACTURAS_HISTORICOS', '4'))
+# Facturación paralela: con N > 1 los clientes se reparten entre N procesos al
+# generar facturas (los ids siguen el orden de NIT igual que en modo secuencial)
+PROCESOS_FACTURACION = int(os.environ.get('PROCESOS_FACTURACION', '0'))
+# Motor de facturación: 'python' (objetos) o 'numpy' (arreglos y bincount, requiere NumPy)
+MOTOR_FACTURACION = os.environ.get('MOTOR_FACTURACION', 'python')
+
 # Inicializar servicios
-xml_manager = XMLManager()
+if ALMACENAMIENTO == 'sqlite':
+    almacenamiento = SQLiteManager(
+        RUTA_SQLITE,
+        meses_facturas_activos=MESES_FACTURAS_ACTIVOS,
+        max_segmentos_historicos=SEGMENTOS_FACTURAS_HISTORICOS
+    )
+else:
+    almacenamiento = XMLManager(
+        modo_bitacora=MODO_BITACORA,
+        carga_paralela=CARGA_PARALELA,
+        particiones_clientes=PARTICIONES_CLIENTES,
+        meses_facturas_activos=MESES_FACTURAS_ACTIVOS,
+        max_segmentos_historicos=SEGMENTOS_FACTURAS_HISTORICOS
+    )
 procesador_config = ProcesadorConfiguracion()
 procesador_consumo = ProcesadorConsumo()
-facturacion_service = FacturacionService()
+facturacion_service = FacturacionService(procesos=PROCESOS_FACTURACION, motor=MOTOR_FACTURACION)
 reporte_service = ReportePDFService()
 
 # Cargar datos existentes al iniciar
-db = xml_manager.cargar_todo()
+db = almacenamiento.cargar_todo()
+
+persistencia = PersistenciaDiferida(
+    almacenamiento, db, durabilidad=DURABILIDAD,
+    intervalo_ms=INTERVALO_GUARDADO_MS, max_cambios=MAX_CAMBIOS_GUARDADO
+)
+# Nada pendiente se pierde en un apagado normal
+atexit.register(persistencia.detener)
 
 
 def guardar_db():
     """Función helper para guardar la base de datos"""
-    xml_manager.guardar_todo(db)
+    if MODO_BITACORA:
+        return  # Ya quedó en la bitácora; la compactación actualiza los XML
+    persistencia.notificar()
+
+
+def _contar_colecciones():
+    """Tamaño actual de las colecciones que crece /configuracion"""
+    return {key: len(db[key]) for key in ('recursos', 'categorias', 'configuraciones', 'clientes', 'instancias')}
+
+
+def _registrar_nuevos(antes):
+    """Registrar en la bitácora los objetos agregados desde `antes`"""
+    operaciones = [
+        ('recursos', 'recurso'),
+        ('categorias', 'categoria'),
+        ('configuraciones', 'configuracion'),
+        ('clientes', 'cliente'),
+        ('instancias', 'instancia')
+    ]
+    for key, op in operaciones:
+        for objeto in db[key][antes[key]:]:
+            almacenamiento.registrar(op, objeto.to_dict())
+
+
+# Endpoints que modifican el db: los reportes y la vista previa solo leen y
+# no tienen por qué esperar a una carga de consumos o a una compactación
+RUTAS_QUE_MODIFICAN = {
+    '/configuracion', '/consumo', '/reset',
+    '/crearRecurso', '/crearCategoria', '/crearConfiguracion',
+    '/crearCliente', '/crearInstancia', '/cancelarInstancia',
+    '/generarFactura',
+}
+
+
+@app.before_request
+def bloquear_mutaciones():
+    """Serializar las peticiones que modifican el db con la compactación de la bitácora"""
+    if MODO_BITACORA:
+        # Se inicia aquí para que el proceso del reloader de Flask no compacte
+        almacenamiento.iniciar_compactacion(db, intervalo=INTERVALO_COMPACTACION)
+    if request.method == 'POST' and request.path in RUTAS_QUE_MODIFICAN:
+        almacenamiento.lock.acquire()
+        g.lock_db = True
+
+
+@app.teardown_request
+def liberar_mutaciones(exc):
+    if g.pop('lock_db', False):
+        almacenamiento.lock.release()
 
 
 # ==================== ENDPOINTS PRINCIPALES ====================
@@ -77,7 +180,14 @@ def recibir_configuracion():
         print(f"Recursos en DB: {[r.id for r in db['recursos']]}")
         print(f"Categorías en DB: {[c.id for c in db['categorias']]}")
 
+        antes = _contar_colecciones()
         resultado = procesador_config.procesar_xml(xml_data, db)
+        _registrar_nuevos(antes)
+        # Los precios actualizados ya subieron la versión; faltan configuraciones e instancias nuevas
+        if any(len(db[key]) != antes[key] for key in ('configuraciones', 'instancias')):
+            db.nueva_version()
+        for recurso in procesador_config.actualizados:
+            almacenamiento.registrar('precio', {'id': recurso.id, 'valorXhora': recurso.valor_x_hora})
         guardar_db()  # Persistir cambios
 
         return jsonify({
@@ -117,7 +227,13 @@ def consultar_datos():
             datos = [i.to_dict() for i in db['instancias']]
             return jsonify({'instancias': datos})
         elif tipo == 'facturas':
-            datos = [f.to_dict() for f in db['facturas']]
+            # ?mes=AAAA-MM devuelve solo ese mes sin recorrer el historial
+            mes = request.args.get('mes')
+            if mes:
+                facturas = db['facturas'].segmento(mes) if mes in db['facturas'].meses() else []
+            else:
+                facturas = db['facturas']
+            datos = [f.to_dict() for f in facturas]
             return jsonify({'facturas': datos})
         else:
             return jsonify({
@@ -142,7 +258,7 @@ def crear_recurso():
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
         # Verificar si el ID ya existe
-        if any(r.id == data['id'] for r in db['recursos']):
+        if db['recursos'].existe(data['id']):
             return jsonify({'error': 'El ID del recurso ya existe'}), 400
 
         # Validar tipo de recurso
@@ -156,6 +272,7 @@ def crear_recurso():
         )
 
         db['recursos'].append(nuevo_recurso)
+        almacenamiento.registrar('recurso', nuevo_recurso.to_dict())
         guardar_db()
 
         return jsonify({
@@ -176,7 +293,7 @@ def crear_categoria():
         if not all(key in data for key in ['id', 'nombre', 'descripcion', 'cargaTrabajo']):
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
-        if any(c.id == data['id'] for c in db['categorias']):
+        if db['categorias'].existe(data['id']):
             return jsonify({'error': 'El ID de la categoría ya existe'}), 400
 
         nueva_categoria = Categoria(
@@ -184,6 +301,7 @@ def crear_categoria():
         )
 
         db['categorias'].append(nueva_categoria)
+        almacenamiento.registrar('categoria', nueva_categoria.to_dict())
         guardar_db()
 
         return jsonify({
@@ -205,7 +323,7 @@ def crear_configuracion():
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
         # Verificar que la categoría exista
-        categoria = next((c for c in db['categorias'] if c.id == data['idCategoria']), None)
+        categoria = db['categorias'].buscar(data['idCategoria'])
         if not categoria:
             return jsonify({'error': 'La categoría especificada no existe'}), 400
 
@@ -216,7 +334,7 @@ def crear_configuracion():
 
         # Agregar recursos a la configuración
         for recurso_data in data['recursos']:
-            if not any(r.id == recurso_data['idRecurso'] for r in db['recursos']):
+            if not db['recursos'].existe(recurso_data['idRecurso']):
                 return jsonify({'error': f'Recurso {recurso_data["idRecurso"]} no existe'}), 400
 
             recurso_config = RecursoConfiguracion(
@@ -227,6 +345,8 @@ def crear_configuracion():
         # Agregar a BD y categoría
         db['configuraciones'].append(configuracion)
         categoria.agregar_configuracion(configuracion)
+        db.nueva_version()
+        almacenamiento.registrar('configuracion', configuracion.to_dict())
         guardar_db()
 
         return jsonify({
@@ -251,7 +371,7 @@ def crear_cliente():
         if not validar_nit(data['nit']):
             return jsonify({'error': 'Formato de NIT inválido'}), 400
 
-        if any(c.nit == data['nit'] for c in db['clientes']):
+        if db['clientes'].existe(data['nit']):
             return jsonify({'error': 'El NIT del cliente ya existe'}), 400
 
         nuevo_cliente = Cliente(
@@ -260,6 +380,7 @@ def crear_cliente():
         )
 
         db['clientes'].append(nuevo_cliente)
+        almacenamiento.registrar('cliente', nuevo_cliente.to_dict())
         guardar_db()
 
         return jsonify({
@@ -281,12 +402,12 @@ def crear_instancia():
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
         # Verificar configuración
-        configuracion = next((c for c in db['configuraciones'] if c.id == data['idConfiguracion']), None)
+        configuracion = db['configuraciones'].buscar(data['idConfiguracion'])
         if not configuracion:
             return jsonify({'error': 'Configuración no existe'}), 400
 
         # Verificar cliente
-        cliente = next((c for c in db['clientes'] if c.nit == data['nitCliente']), None)
+        cliente = db['clientes'].buscar(data['nitCliente'])
         if not cliente:
             return jsonify({'error': 'Cliente no existe'}), 400
 
@@ -303,6 +424,8 @@ def crear_instancia():
 
         db['instancias'].append(instancia)
         cliente.agregar_instancia(instancia)
+        db.nueva_version()
+        almacenamiento.registrar('instancia', instancia.to_dict())
         guardar_db()
 
         return jsonify({
@@ -324,7 +447,7 @@ def cancelar_instancia():
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
         # Buscar instancia
-        instancia = next((i for i in db['instancias'] if i.id == data['idInstancia']), None)
+        instancia = db['instancias'].buscar(data['idInstancia'])
         if not instancia:
             return jsonify({'error': 'Instancia no encontrada'}), 404
 
@@ -335,6 +458,12 @@ def cancelar_instancia():
 
         # Cancelar instancia
         instancia.cancelar(fecha_final)
+        db.nueva_version()
+        almacenamiento.registrar('cancelacion', {
+            'idInstancia': instancia.id,
+            'nitCliente': instancia.nit_cliente,
+            'fechaFinal': fecha_final
+        })
         guardar_db()
 
         return jsonify({
@@ -346,6 +475,33 @@ def cancelar_instancia():
         return jsonify({'error': str(e)}), 500
 
 
+def _pide_ndjson():
+    """La respuesta va en streaming si se pide ?formato=ndjson o Accept: application/x-ndjson"""
+    return (request.args.get('formato') == 'ndjson'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+
+def _facturas_ndjson(fecha_inicio, fecha_fin):
+    """Una factura JSON por línea, enviada apenas se genera"""
+    # Flask consume el generador después de teardown_request, que ya soltó el lock
+    # de la petición: se toma aquí y se suelta al terminar o cortarse la respuesta
+    almacenamiento.lock.acquire()
+    try:
+        for factura in facturacion_service.iterar_facturas(db, fecha_inicio, fecha_fin):
+            factura_data = factura.to_dict()
+            almacenamiento.registrar('factura', factura_data)
+            yield json.dumps(factura_data, ensure_ascii=False) + "\n"
+    except Exception as e:
+        # El estado 200 ya salió: el error va como última línea
+        yield json.dumps({'error': str(e)}, ensure_ascii=False) + "\n"
+    finally:
+        # Lo generado se guarda aunque el cliente corte la conexión a mitad
+        try:
+            guardar_db()
+        finally:
+            almacenamiento.lock.release()
+
+
 @app.route('/generarFactura', methods=['POST'])
 def generar_factura():
     """Generar factura para un rango de fechas """
@@ -355,12 +511,21 @@ def generar_factura():
         if not all(key in data for key in ['fechaInicio', 'fechaFin']):
             return jsonify({'error': 'Faltan campos requeridos'}), 400
 
+        if _pide_ndjson():
+            # Modo streaming: la memoria no crece con la cantidad de facturas
+            if not es_rango_fecha_valido(data['fechaInicio'], data['fechaFin']):
+                return jsonify({'error': 'Rango de fechas inválido'}), 400
+            return Response(stream_with_context(_facturas_ndjson(data['fechaInicio'], data['fechaFin'])),
+                            mimetype='application/x-ndjson')
+
         # Usar el servicio de facturación
         resultado = facturacion_service.generar_facturas(db, data['fechaInicio'], data['fechaFin'])
 
         if 'error' in resultado:
             return jsonify({'error': resultado['error']}), 400
 
+        for factura_data in resultado['detalle']:
+            almacenamiento.registrar('factura', factura_data)
         guardar_db()
 
         return jsonify({
@@ -372,6 +537,31 @@ def generar_factura():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/previsualizarFactura', methods=['POST'])
+def previsualizar_factura():
+    """Facturas que se generarían en un rango de fechas, sin guardarlas"""
+    try:
+        data = request.get_json()
+
+        if not all(key in data for key in ['fechaInicio', 'fechaFin']):
+            return jsonify({'error': 'Faltan campos requeridos'}), 400
+
+        resultado = facturacion_service.previsualizar_facturas(db, data['fechaInicio'], data['fechaFin'])
+
+        if 'error' in resultado:
+            return jsonify({'error': resultado['error']}), 400
+
+        return jsonify({
+            'mensaje': f"{resultado['facturas_generadas']} facturas se generarían en el período",
+            'facturas': resultado['detalle'],
+            'versionDatos': resultado['version'],
+            'desdeCache': resultado['desde_cache']
+        }), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/reporte/pdf/detalle-factura', methods=['POST'])
 def generar_pdf_detalle_factura():
     """Generar PDF con detalle de factura"""
@@ -382,7 +572,7 @@ def generar_pdf_detalle_factura():
             return jsonify({'error': 'ID de factura requerido'}), 400
 
         # Buscar factura
-        factura = next((f for f in db['facturas'] if f.id == data['idFactura']), None)
+        factura = db['facturas'].buscar(data['idFactura'])
         if not factura:
             return jsonify({'error': 'Factura no encontrada'}), 404
 
@@ -463,7 +653,8 @@ def recibir_consumo():
     try:
         xml_data = request.data.decode('utf-8')
         resultado = procesador_consumo.procesar_xml(xml_data, db)
-        guardar_db()  # Persistir cambios
+        # El almacén de consumos es append-only: se escribe directo, sin guardar_db
+        almacenamiento.agregar_consumos(procesador_consumo.registrados)
 
         return jsonify({
             'mensaje': 'Consumo procesado exitosamente',
@@ -478,7 +669,10 @@ def reset_sistema():
     """Resetear todos los datos del sistema"""
     try:
         for key in db:
-            db[key] = []
+            db[key].clear()
+        db.nueva_version()
+        almacenamiento.eliminar_consumos()
+        almacenamiento.registrar('reset', {})
         guardar_db()
         return jsonify({'mensaje': 'Sistema reseteado exitosamente'}), 200
     except Exception as e:
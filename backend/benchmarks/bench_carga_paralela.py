@@ -0,0 +1,112 @@
+"""
+Benchmark de la carga paralela de los XML en cargar_todo.
+
+Mide el tiempo de cada archivo por separado, la carga secuencial completa y la
+carga con XMLManager(carga_paralela=True). Con archivos de tamaño parecido la
+carga paralela debería acercarse al archivo más lento y no a la suma.
+
+Uso:
+    python benchmarks/bench_carga_paralela.py [num_clientes]
+"""
+import gc
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database.xml_manager import XMLManager
+from models.recurso import Recurso
+from models.categoria import Categoria
+from models.configuracion import Configuracion, RecursoConfiguracion
+from models.cliente import Cliente
+from models.instancia import Instancia
+from models.factura import Factura, DetalleFactura
+
+INSTANCIAS_POR_CLIENTE = 4
+
+
+def generar_datos(directorio, num_clientes):
+    """Escribir los cuatro XML con volúmenes comparables"""
+    manager = XMLManager(directorio, usar_snapshot=False)
+
+    recursos = [Recurso(n, f"Recurso {n}", f"R{n}", "unidad", "Hardware", 1.5) for n in range(1, num_clientes + 1)]
+
+    categorias = []
+    id_config = 1
+    for n in range(num_clientes // 10):
+        categoria = Categoria(n + 1, f"Categoría {n}", "Descripción", "Media")
+        for _ in range(10):
+            configuracion = Configuracion(id_config, f"Config {id_config}", "Descripción", categoria.id)
+            for id_recurso in range(1, 4):
+                configuracion.agregar_recurso(RecursoConfiguracion(id_recurso, 2))
+            categoria.agregar_configuracion(configuracion)
+            id_config += 1
+        categorias.append(categoria)
+
+    clientes = []
+    facturas = []
+    id_instancia = 1
+    for n in range(num_clientes):
+        cliente = Cliente(f"{100000 + n}-{n % 10}", f"Cliente {n}", f"usuario{n}", "clave",
+                          f"Dirección {n}", f"cliente{n}@example.com")
+        factura = Factura(n + 1, cliente.nit, "01/01/2024", "01/12/2023 - 31/12/2023")
+        for _ in range(INSTANCIAS_POR_CLIENTE):
+            cliente.agregar_instancia(Instancia(id_instancia, 1, f"Instancia {id_instancia}",
+                                                "01/01/2023", cliente.nit))
+            factura.agregar_detalle(DetalleFactura(id_instancia, 10.5, 42.0))
+            id_instancia += 1
+        clientes.append(cliente)
+        facturas.append(factura)
+
+    manager.guardar_recursos(recursos)
+    manager.guardar_categorias(categorias)
+    manager.guardar_clientes(clientes)
+    manager.guardar_facturas(facturas)
+
+
+def tamano_mb(directorio, coleccion):
+    """Tamaño de una colección: su XML único o todos los archivos de su carpeta"""
+    ruta = os.path.join(directorio, f"{coleccion}.xml")
+    if os.path.exists(ruta):
+        return os.path.getsize(ruta) / 1024 / 1024
+    carpeta = os.path.join(directorio, coleccion)
+    return sum(os.path.getsize(os.path.join(carpeta, f)) for f in os.listdir(carpeta)) / 1024 / 1024
+
+
+def cronometrar(funcion):
+    # cargar_todo apaga el recolector de ciclos; se mide todo en las mismas condiciones
+    gc.disable()
+    try:
+        inicio = time.perf_counter()
+        funcion()
+        return time.perf_counter() - inicio
+    finally:
+        gc.enable()
+
+
+def main():
+    num_clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 30000
+
+    with tempfile.TemporaryDirectory() as directorio:
+        generar_datos(directorio, num_clientes)
+        secuencial = XMLManager(directorio, usar_snapshot=False)
+        paralelo = XMLManager(directorio, usar_snapshot=False, carga_paralela=True)
+
+        print(f"Clientes: {num_clientes}  CPUs: {os.cpu_count()}")
+        tiempos = {}
+        for coleccion in ("recursos", "categorias", "clientes", "facturas"):
+            tamano = tamano_mb(directorio, coleccion)
+            tiempos[coleccion] = cronometrar(lambda: list(getattr(secuencial, f"iterar_{coleccion}")()))
+            print(f"  {coleccion:<16} {tamano:6.1f} MB  {tiempos[coleccion]:6.2f} s")
+
+        print(f"Suma de archivos:   {sum(tiempos.values()):6.2f} s")
+        print(f"Archivo más lento:  {max(tiempos.values()):6.2f} s")
+        print(f"cargar_todo secuencial: {cronometrar(secuencial.cargar_todo):6.2f} s")
+        print(f"cargar_todo paralelo:   {cronometrar(paralelo.cargar_todo):6.2f} s")
+
+
+if __name__ == '__main__':
+    main()
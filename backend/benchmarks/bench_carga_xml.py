@@ -0,0 +1,172 @@
+"""
+Benchmark de memoria de la carga de clientes.xml y de las facturas.
+
+Compara el pico de RSS de la carga anterior (ET.parse + lista de diccionarios +
+conversión a objetos) con los cargadores en streaming basados en iterparse.
+Cada medición corre en un proceso aparte para que el pico de RSS sea propio.
+
+Uso:
+    python benchmarks/bench_carga_xml.py [num_clientes ...]
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database.xml_manager import XMLManager
+from models.cliente import Cliente
+from models.instancia import Instancia
+from models.factura import Factura, DetalleFactura
+
+INSTANCIAS_POR_CLIENTE = 4
+
+
+def cargar_clientes_dom(directorio):
+    """Carga anterior de clientes.xml: árbol completo con ET.parse y lista de diccionarios"""
+    try:
+        tree = ET.parse(os.path.join(directorio, "clientes.xml"))
+        root = tree.getroot()
+
+        clientes = []
+        for cliente_elem in root.findall('cliente'):
+            cliente = {
+                'nit': cliente_elem.get('nit'),
+                'nombre': cliente_elem.find('nombre').text,
+                'usuario': cliente_elem.find('usuario').text,
+                'clave': cliente_elem.find('clave').text,
+                'direccion': cliente_elem.find('direccion').text,
+                'correoElectronico': cliente_elem.find('correoElectronico').text,
+                'instancias': []
+            }
+
+            lista_instancias = cliente_elem.find('listaInstancias')
+            if lista_instancias is not None:
+                for instancia_elem in lista_instancias.findall('instancia'):
+                    instancia = {
+                        'id': int(instancia_elem.get('id')),
+                        'idConfiguracion': int(instancia_elem.find('idConfiguracion').text),
+                        'nombre': instancia_elem.find('nombre').text,
+                        'fechaInicio': instancia_elem.find('fechaInicio').text,
+                        'estado': instancia_elem.find('estado').text,
+                        'fechaFinal': instancia_elem.find('fechaFinal').text if instancia_elem.find(
+                            'fechaFinal') is not None else None,
+                        'nitCliente': cliente['nit'],
+                        'consumos': []
+                    }
+                    cliente['instancias'].append(instancia)
+
+            clientes.append(cliente)
+
+        return clientes
+    except FileNotFoundError:
+        return []
+
+
+def cargar_facturas_dom(directorio):
+    """Carga anterior de las facturas: un árbol completo por segmento y lista de diccionarios"""
+    carpeta = os.path.join(directorio, "facturas")
+    try:
+        archivos = sorted(f for f in os.listdir(carpeta) if f.endswith('.xml') and f != 'manifiesto.xml')
+    except FileNotFoundError:
+        return []
+
+    facturas = []
+    for archivo in archivos:
+        for factura_elem in ET.parse(os.path.join(carpeta, archivo)).getroot().findall('factura'):
+            factura = {
+                'id': int(factura_elem.get('id')),
+                'nitCliente': factura_elem.find('nitCliente').text,
+                'fechaEmision': factura_elem.find('fechaEmision').text,
+                'periodo': factura_elem.find('periodo').text,
+                'montoTotal': float(factura_elem.find('montoTotal').text),
+                'detalles': []
+            }
+
+            detalles_elem = factura_elem.find('detalles')
+            if detalles_elem is not None:
+                for detalle_elem in detalles_elem.findall('detalle'):
+                    factura['detalles'].append({
+                        'idInstancia': int(detalle_elem.find('idInstancia').text),
+                        'tiempoTotal': float(detalle_elem.find('tiempoTotal').text),
+                        'monto': float(detalle_elem.find('monto').text)
+                    })
+
+            facturas.append(factura)
+
+    return facturas
+
+
+def generar_datos(directorio, num_clientes):
+    """Escribir clientes.xml y los segmentos de facturas sintéticos"""
+    manager = XMLManager(directorio)
+
+    clientes = []
+    facturas = []
+    id_instancia = 1
+    for n in range(num_clientes):
+        cliente = Cliente(f"{100000 + n}-{n % 10}", f"Cliente {n}", f"usuario{n}", "clave",
+                          f"Dirección {n}", f"cliente{n}@example.com")
+        factura = Factura(n + 1, cliente.nit, "01/01/2024", "01/12/2023 - 31/12/2023")
+        for _ in range(INSTANCIAS_POR_CLIENTE):
+            cliente.agregar_instancia(Instancia(id_instancia, 1, f"Instancia {id_instancia}",
+                                                "01/01/2023", cliente.nit))
+            factura.agregar_detalle(DetalleFactura(id_instancia, 10.5, 42.0))
+            id_instancia += 1
+        clientes.append(cliente)
+        facturas.append(factura)
+
+    manager.guardar_clientes(clientes)
+    manager.guardar_facturas(facturas)
+
+
+def medir(modo, directorio):
+    """Cargar los datos en este proceso y reportar el pico de RSS en KB"""
+    manager = XMLManager(directorio)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if modo == 'dom':
+        # Carga anterior: árbol completo + diccionarios + objetos
+        clientes = [Cliente.from_dict(c) for c in cargar_clientes_dom(directorio)]
+        facturas = [Factura.from_dict(f) for f in cargar_facturas_dom(directorio)]
+    else:
+        clientes = list(manager.iterar_clientes())
+        facturas = list(manager.iterar_facturas())
+
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{base} {pico} {len(clientes)} {len(facturas)}")
+
+
+def main():
+    tamanos = [int(n) for n in sys.argv[1:]] or [2000, 10000, 50000]
+
+    print(f"{'clientes':>10} {'MB en disco':>12} {'RSS ET.parse':>14} {'RSS iterparse':>14}")
+    for num_clientes in tamanos:
+        with tempfile.TemporaryDirectory() as directorio:
+            generar_datos(directorio, num_clientes)
+            carpeta_facturas = os.path.join(directorio, "facturas")
+            tamano = (os.path.getsize(os.path.join(directorio, "clientes.xml")) +
+                      sum(os.path.getsize(os.path.join(carpeta_facturas, f))
+                          for f in os.listdir(carpeta_facturas))) / 1024 / 1024
+
+            resultados = {}
+            for modo in ('dom', 'stream'):
+                salida = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), '--medir', modo, directorio],
+                    capture_output=True, text=True, check=True
+                ).stdout.split()
+                base, pico = int(salida[0]), int(salida[1])
+                resultados[modo] = (pico - base) / 1024  # ru_maxrss está en KB en Linux
+
+            print(f"{num_clientes:>10} {tamano:>12.1f} {resultados['dom']:>11.1f} MB {resultados['stream']:>11.1f} MB")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--medir':
+        medir(sys.argv[2], sys.argv[3])
+    else:
+        main()
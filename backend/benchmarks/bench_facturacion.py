@@ -0,0 +1,103 @@
+"""
+Benchmark de FacturacionService.generar_facturas.
+
+Arma en memoria un db con num_clientes clientes e INSTANCIAS_POR_CLIENTE
+instancias por cliente (10k y 100k por defecto), con CONSUMOS_POR_INSTANCIA
+consumos cada una, y factura un mes. Se mide también con la décima parte de
+los clientes: con la facturación en una sola pasada el tiempo por instancia
+debería mantenerse parecido en los dos tamaños.
+
+Después se factura el tamaño completo con FacturacionService(procesos=N) y se
+comprueba que las facturas sean idénticas a las de la corrida secuencial.
+
+Uso:
+    python benchmarks/bench_facturacion.py [num_clientes] [procesos]
+"""
+import gc
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database.archivo_facturas import ArchivoFacturas
+from database.repositorio import Repositorio
+from models.recurso import Recurso
+from models.categoria import Categoria
+from models.configuracion import Configuracion, RecursoConfiguracion
+from models.cliente import Cliente
+from models.instancia import Instancia, Consumo
+from services.facturacion_service import FacturacionService
+
+INSTANCIAS_POR_CLIENTE = 10
+CONSUMOS_POR_INSTANCIA = 3
+NUM_CONFIGURACIONES = 100
+
+
+def generar_db(num_clientes):
+    """db en memoria con consumos en enero de 2024"""
+    recursos = [Recurso(n, f"Recurso {n}", f"R{n}", "unidad", "Hardware", 0.5 * n) for n in range(1, 6)]
+
+    categoria = Categoria(1, "Categoría 1", "Descripción", "Media")
+    for id_config in range(1, NUM_CONFIGURACIONES + 1):
+        configuracion = Configuracion(id_config, f"Config {id_config}", "Descripción", categoria.id)
+        for id_recurso in range(1, 4):
+            configuracion.agregar_recurso(RecursoConfiguracion(id_recurso, 2))
+        categoria.agregar_configuracion(configuracion)
+
+    clientes = []
+    id_instancia = 1
+    for n in range(num_clientes):
+        cliente = Cliente(f"{100000 + n}-{n % 10}", f"Cliente {n}", f"usuario{n}", "clave",
+                          f"Dirección {n}", f"cliente{n}@example.com")
+        for _ in range(INSTANCIAS_POR_CLIENTE):
+            instancia = Instancia(id_instancia, id_instancia % NUM_CONFIGURACIONES + 1,
+                                  f"Instancia {id_instancia}", "01/01/2023", cliente.nit)
+            for dia in range(CONSUMOS_POR_INSTANCIA):
+                instancia.agregar_consumo(Consumo(1.5, f"{dia + 1:02d}/01/2024 10:00"))
+            cliente.agregar_instancia(instancia)
+            id_instancia += 1
+        clientes.append(cliente)
+
+    return Repositorio({
+        'recursos': recursos,
+        'categorias': [categoria],
+        'configuraciones': list(categoria.configuraciones),
+        'clientes': clientes,
+        'instancias': [instancia for cliente in clientes for instancia in cliente.instancias],
+        'consumos': [],
+        'facturas': ArchivoFacturas()
+    })
+
+
+def cronometrar(num_clientes, procesos=0):
+    db = generar_db(num_clientes)
+    servicio = FacturacionService(procesos=procesos)
+    gc.disable()
+    try:
+        inicio = time.perf_counter()
+        resultado = servicio.generar_facturas(db, "01/01/2024", "31/01/2024")
+        return time.perf_counter() - inicio, resultado['detalle']
+    finally:
+        gc.enable()
+
+
+def main():
+    num_clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    procesos = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    print(f"CPUs: {os.cpu_count()}")
+    for clientes in (num_clientes // 10, num_clientes):
+        instancias = clientes * INSTANCIAS_POR_CLIENTE
+        segundos, facturas = cronometrar(clientes)
+        print(f"Clientes: {clientes:>7}  instancias: {instancias:>8}  consumos: {instancias * CONSUMOS_POR_INSTANCIA:>8}  "
+              f"facturas: {len(facturas):>7}  {segundos:6.2f} s  ({segundos / instancias * 1e6:5.1f} µs/instancia)")
+
+    segundos_paralelo, facturas_paralelo = cronometrar(num_clientes, procesos)
+    print(f"Con {procesos} procesos:  {segundos_paralelo:6.2f} s  (x{segundos / segundos_paralelo:.2f})  "
+          f"idénticas: {facturas_paralelo == facturas}")
+
+
+if __name__ == '__main__':
+    main()
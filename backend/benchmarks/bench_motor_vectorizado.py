@@ -0,0 +1,129 @@
+"""
+Benchmark del motor de facturación vectorizado (NumPy) contra el motor en Python.
+
+Arma en memoria num_clientes clientes con INSTANCIAS_POR_CLIENTE instancias y
+DIAS_CON_CONSUMO acumulados diarios cada una (3 millones de registros con los
+valores por defecto) y mide la facturación de un mes y los dos reportes
+analíticos con cada motor. Al final compara los montos de ambos.
+
+El motor numpy arma las columnas en la primera llamada (el primer reporte) y
+las reutiliza en las siguientes mientras no lleguen consumos nuevos.
+
+Uso:
+    python benchmarks/bench_motor_vectorizado.py [num_clientes]
+"""
+import gc
+import math
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from database.archivo_facturas import ArchivoFacturas
+from database.repositorio import Repositorio
+from models.recurso import Recurso
+from models.categoria import Categoria
+from models.configuracion import Configuracion, RecursoConfiguracion
+from models.cliente import Cliente
+from models.instancia import Instancia
+from services.facturacion_service import FacturacionService
+from utils.date_utils import fecha_hora_a_minutos
+
+INSTANCIAS_POR_CLIENTE = 10
+DIAS_CON_CONSUMO = 30
+NUM_CONFIGURACIONES = 100
+PRIMER_DIA = fecha_hora_a_minutos("01/01/2024") // (24 * 60)
+
+
+def generar_db(num_clientes):
+    """db en memoria con los acumulados diarios ya armados (de enero a abril de 2024)"""
+    recursos = [Recurso(n, f"Recurso {n}", f"R{n}", "unidad", "Hardware", 0.5 * n) for n in range(1, 6)]
+
+    categorias = [Categoria(n, f"Categoría {n}", "Descripción", "Media") for n in range(1, 11)]
+    configuraciones = []
+    for id_config in range(1, NUM_CONFIGURACIONES + 1):
+        categoria = categorias[id_config % len(categorias)]
+        configuracion = Configuracion(id_config, f"Config {id_config}", "Descripción", categoria.id)
+        for id_recurso in range(1, 1 + id_config % 5 + 1):
+            configuracion.agregar_recurso(RecursoConfiguracion(id_recurso, id_config % 3 + 1))
+        categoria.agregar_configuracion(configuracion)
+        configuraciones.append(configuracion)
+
+    clientes = []
+    id_instancia = 1
+    for n in range(num_clientes):
+        cliente = Cliente(f"{100000 + n}-{n % 10}", f"Cliente {n}", f"usuario{n}", "clave",
+                          f"Dirección {n}", f"cliente{n}@example.com")
+        for _ in range(INSTANCIAS_POR_CLIENTE):
+            instancia = Instancia(id_instancia, id_instancia % NUM_CONFIGURACIONES + 1,
+                                  f"Instancia {id_instancia}", "01/01/2023", cliente.nit)
+            # Días repartidos entre enero y abril: parte cae fuera del mes facturado
+            inicio = PRIMER_DIA + id_instancia % 90
+            instancia.diarios.update((inicio + dia, 0.25 * (dia % 8 + 1)) for dia in range(DIAS_CON_CONSUMO))
+            cliente.agregar_instancia(instancia)
+            id_instancia += 1
+        clientes.append(cliente)
+
+    return Repositorio({
+        'recursos': recursos,
+        'categorias': categorias,
+        'configuraciones': configuraciones,
+        'clientes': clientes,
+        'instancias': [instancia for cliente in clientes for instancia in cliente.instancias],
+        'consumos': [],
+        'facturas': ArchivoFacturas()
+    })
+
+
+def cronometrar(funcion):
+    gc.disable()
+    try:
+        inicio = time.perf_counter()
+        resultado = funcion()
+        return time.perf_counter() - inicio, resultado
+    finally:
+        gc.enable()
+
+
+def montos(facturas):
+    return [(f['nitCliente'], [(d['idInstancia'], d['monto']) for d in f['detalles']]) for f in facturas]
+
+
+def iguales(a, b):
+    if len(a) != len(b):
+        return False
+    for (nit_a, detalles_a), (nit_b, detalles_b) in zip(a, b):
+        if nit_a != nit_b or len(detalles_a) != len(detalles_b):
+            return False
+        for (id_a, monto_a), (id_b, monto_b) in zip(detalles_a, detalles_b):
+            if id_a != id_b or not math.isclose(monto_a, monto_b, rel_tol=1e-9):
+                return False
+    return True
+
+
+def main():
+    num_clientes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    db = generar_db(num_clientes)
+    registros = sum(len(instancia.diarios) for instancia in db['instancias'])
+    print(f"Clientes: {num_clientes}  instancias: {len(db['instancias'])}  acumulados diarios: {registros}")
+
+    resultados = {}
+    for motor in ('python', 'numpy'):
+        servicio = FacturacionService(motor=motor)
+        print(f"Motor {motor}:")
+        for tipo in ('categorias', 'recursos'):
+            segundos, _ = cronometrar(lambda: servicio.generar_reporte_analitico(db, "01/01/2024", "31/01/2024", tipo))
+            print(f"  reporte {tipo:<11} {segundos:6.2f} s")
+        # Cada motor factura sobre un archivo de facturas vacío para que los ids coincidan
+        db['facturas'] = ArchivoFacturas()
+        segundos, resultado = cronometrar(lambda: servicio.generar_facturas(db, "01/01/2024", "31/01/2024"))
+        print(f"  facturación         {segundos:6.2f} s  ({resultado['facturas_generadas']} facturas)")
+        resultados[motor] = montos(resultado['detalle'])
+
+    print(f"Mismos montos: {iguales(resultados['python'], resultados['numpy'])}")
+
+
+if __name__ == '__main__':
+    main()
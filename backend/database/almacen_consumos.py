@@ -0,0 +1,132 @@
+import mmap
+import os
+import struct
+import threading
+from models.instancia import Consumo, acumular_diarios
+
+
+class AlmacenConsumos:
+    """
+    Almacén binario append-only de consumos: un archivo por instancia con
+    registros de tamaño fijo (minutos desde 1970 como int64, horas como float64).
+
+    Junto a cada `<id>.bin` va `<id>.dia` con el acumulado diario (día desde
+    1970 como int64, horas como float64), también append-only: un día puede
+    aparecer varias veces y al leer se suman. Cada lote del .dia empieza con
+    un registro CONTEO que dice cuántos registros del .bin resume; si la suma
+    no coincide con el .bin, el .dia se rearma.
+    """
+
+    REGISTRO = struct.Struct('<qd')
+    # Registro del .dia que no es un día: cuántos registros del .bin cubre el lote que sigue
+    CONTEO = -(2 ** 63)
+
+    def __init__(self, directorio, solo_lectura=False):
+        self.directorio = directorio
+        # Solo lectura: un .dia desactualizado se suma en memoria en lugar de rearmarlo
+        self.solo_lectura = solo_lectura
+        self.lock = threading.Lock()
+        # Instancias cuyo .dia ya se comprobó contra el .bin en este proceso
+        self._verificados = set()
+        if not solo_lectura and not os.path.exists(self.directorio):
+            os.makedirs(self.directorio)
+
+    def __reduce__(self):
+        # En otro proceso (facturación paralela) solo se lee: el .dia no se rearma desde ahí
+        return (self.__class__, (self.directorio, True))
+
+    def _ruta(self, id_instancia, extension="bin"):
+        return os.path.join(self.directorio, f"{id_instancia}.{extension}")
+
+    def _agregar_registros(self, ruta, datos):
+        with open(ruta, 'ab') as f:
+            f.write(datos)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _leer_registros(self, ruta):
+        if not os.path.exists(ruta) or os.path.getsize(ruta) == 0:
+            return []
+        with open(ruta, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as datos:
+                # Un registro incompleto al final (caída a medio escribir) se descarta
+                completo = len(datos) - len(datos) % self.REGISTRO.size
+                return list(self.REGISTRO.iter_unpack(datos[:completo]))
+
+    def _lote_diarios(self, registros, diarios):
+        """Bytes de un lote del .dia: el conteo de registros del .bin y luego los días"""
+        return self.REGISTRO.pack(self.CONTEO, registros) + b''.join(
+            self.REGISTRO.pack(dia, horas) for dia, horas in diarios.items())
+
+    def agregar(self, id_instancia, consumos):
+        """Agregar consumos (objetos Consumo) al final del archivo de la instancia"""
+        consumos = [consumo for consumo in consumos if consumo.marca is not None]
+        if not consumos:
+            return
+        datos = b''.join(self.REGISTRO.pack(consumo.marca, consumo.tiempo) for consumo in consumos)
+        with self.lock:
+            self._verificar_diarios(id_instancia)
+            # Primero el acumulado: si se cae antes de escribir el .bin, el conteo del
+            # .dia queda por delante y la próxima lectura lo rearma desde el .bin
+            self._agregar_registros(self._ruta(id_instancia, "dia"),
+                                    self._lote_diarios(len(consumos), acumular_diarios(consumos)))
+            self._agregar_registros(self._ruta(id_instancia), datos)
+
+    def leer(self, id_instancia):
+        """Leer todos los consumos de una instancia mapeando el archivo en memoria"""
+        return [
+            Consumo(tiempo, marca=minutos)
+            for minutos, tiempo in self._leer_registros(self._ruta(id_instancia))
+        ]
+
+    def leer_diarios(self, id_instancia):
+        """Horas por día de una instancia, sin leer sus consumos"""
+        with self.lock:
+            vigente = self._verificar_diarios(id_instancia)
+        if not vigente:
+            return acumular_diarios(self.leer(id_instancia))
+        diarios = {}
+        for dia, horas in self._leer_registros(self._ruta(id_instancia, "dia")):
+            if dia != self.CONTEO:
+                diarios[dia] = diarios.get(dia, 0.0) + horas
+        return diarios
+
+    def _verificar_diarios(self, id_instancia):
+        """
+        Rearmar el .dia si no cubre exactamente los registros del .bin: falta
+        (almacén anterior al acumulado), no trae conteos o quedó a medias por una caída.
+        Devuelve False si el .dia no sirve y no se pudo rearmar (solo lectura).
+        """
+        if id_instancia in self._verificados:
+            return True
+        ruta_bin = self._ruta(id_instancia)
+        ruta_dia = self._ruta(id_instancia, "dia")
+        tamanio = os.path.getsize(ruta_bin) if os.path.exists(ruta_bin) else 0
+        registros = tamanio // self.REGISTRO.size
+        if tamanio % self.REGISTRO.size and not self.solo_lectura:
+            # Registro cortado al final: se quita para que los siguientes queden alineados
+            os.truncate(ruta_bin, registros * self.REGISTRO.size)
+
+        cubiertos = None
+        if os.path.exists(ruta_dia) and os.path.getsize(ruta_dia) % self.REGISTRO.size == 0:
+            cubiertos = sum(int(horas) for dia, horas in self._leer_registros(ruta_dia) if dia == self.CONTEO)
+        if cubiertos != registros and (registros or os.path.exists(ruta_dia)):
+            if self.solo_lectura:
+                return False
+            diarios = acumular_diarios(self.leer(id_instancia))
+            ruta_temporal = ruta_dia + ".tmp"
+            with open(ruta_temporal, 'wb') as f:
+                f.write(self._lote_diarios(registros, diarios))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(ruta_temporal, ruta_dia)
+        self._verificados.add(id_instancia)
+        return True
+
+    def eliminar_todo(self):
+        """Borrar todos los consumos guardados"""
+        with self.lock:
+            for nombre in os.listdir(self.directorio):
+                if nombre.endswith(('.bin', '.dia')):
+                    os.remove(os.path.join(self.directorio, nombre))
+            self._verificados.clear()
@@ -0,0 +1,169 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+SIN_FECHA = "0000-00"  # Segmento de facturas con fecha de emisión ilegible
+
+
+def mes_de_factura(factura):
+    """Mes de emisión ('AAAA-MM') de una factura, que define su segmento"""
+    try:
+        return datetime.strptime(str(factura.fecha_emision).strip()[:10], '%d/%m/%Y').strftime('%Y-%m')
+    except ValueError:
+        return SIN_FECHA
+
+
+class ArchivoFacturas:
+    """
+    Facturas particionadas por mes de emisión.
+
+    Los segmentos de los últimos `meses_activos` meses se cargan al iniciar y
+    quedan en memoria; los históricos se piden al `cargador` cuando se
+    necesitan y se mantienen en una LRU de a lo sumo `max_historicos`
+    segmentos. Del resto solo se conoce el índice (total e ids mínimo/máximo),
+    así la memoria depende de la ventana activa y no de todo el historial.
+    """
+
+    def __init__(self, cargador=None, meses_activos=3, max_historicos=4):
+        self.cargador = cargador  # Función mes -> lista de Factura
+        self.meses_activos = meses_activos
+        self.max_historicos = max_historicos
+        self._indice = {}  # mes -> [total, id mínimo, id máximo]
+        self._segmentos = {}  # mes -> lista de Factura ya cargada
+        self._historicos = OrderedDict()  # Meses fuera de la ventana cargados, en orden LRU
+        self.modificados = set()  # Meses con cambios sin guardar
+        # Los reportes cargan segmentos sin el lock del almacenamiento
+        self._lock = threading.RLock()
+
+    # ==================== VENTANA ACTIVA ====================
+
+    def _mes_corte(self):
+        hoy = datetime.now()
+        meses = hoy.year * 12 + hoy.month - 1 - (self.meses_activos - 1)
+        return f"{meses // 12:04d}-{meses % 12 + 1:02d}"
+
+    def es_activo(self, mes):
+        return mes >= self._mes_corte()
+
+    def activar(self, cargador):
+        """Enlazar el cargador y ajustar la ventana activa al mes actual"""
+        self.cargador = cargador
+        for mes in sorted(self._indice):
+            if self.es_activo(mes):
+                self._historicos.pop(mes, None)
+                self.segmento(mes)
+            elif mes in self._segmentos and mes not in self._historicos:
+                self._historicos[mes] = None
+        self._liberar_historicos()
+
+    def _liberar_historicos(self, conservar=None):
+        """Descartar los segmentos históricos menos usados (los modificados esperan al guardado)"""
+        with self._lock:
+            for mes in list(self._historicos):
+                if len(self._historicos) <= self.max_historicos:
+                    break
+                if mes not in self.modificados and mes != conservar:
+                    del self._historicos[mes]
+                    del self._segmentos[mes]
+
+    def registrar_segmento(self, mes, total, id_minimo, id_maximo):
+        """Agregar al índice un segmento guardado sin cargarlo"""
+        self._indice[mes] = [total, id_minimo, id_maximo]
+
+    def segmento(self, mes):
+        """Facturas de un mes, cargándolas si hace falta"""
+        with self._lock:
+            if mes in self._segmentos:
+                if mes in self._historicos:
+                    self._historicos.move_to_end(mes)
+                return self._segmentos[mes]
+
+            facturas = self.cargador(mes) if self.cargador and mes in self._indice else []
+            self._segmentos[mes] = facturas
+            if not self.es_activo(mes):
+                self._historicos[mes] = None
+                self._liberar_historicos(conservar=mes)
+            return facturas
+
+    # ==================== INTERFAZ DE LISTA ====================
+
+    def meses(self):
+        return sorted(self._indice)
+
+    def cargados(self):
+        """Meses que están en memoria"""
+        return sorted(self._segmentos)
+
+    def append(self, factura):
+        mes = mes_de_factura(factura)
+        self.segmento(mes).append(factura)
+        entrada = self._indice.get(mes)
+        if entrada is None:
+            self._indice[mes] = [1, factura.id, factura.id]
+        else:
+            entrada[0] += 1
+            entrada[1] = min(entrada[1], factura.id)
+            entrada[2] = max(entrada[2], factura.id)
+        self.modificados.add(mes)
+
+    def extend(self, facturas):
+        for factura in facturas:
+            self.append(factura)
+
+    def clear(self):
+        self._indice.clear()
+        self._segmentos.clear()
+        self._historicos.clear()
+        self.modificados.clear()
+
+    def __iter__(self):
+        for mes in self.meses():
+            yield from list(self.segmento(mes))
+
+    def __len__(self):
+        return sum(entrada[0] for entrada in self._indice.values())
+
+    def __bool__(self):
+        return bool(self._indice)
+
+    def buscar(self, id_factura):
+        """Factura por id: solo se cargan los segmentos cuyo rango de ids la puede contener"""
+        # El id puede llegar como texto desde el JSON; uno que no es número no existe
+        try:
+            id_factura = int(id_factura)
+        except (TypeError, ValueError):
+            return None
+        candidatos = [mes for mes, (_, id_minimo, id_maximo) in list(self._indice.items())
+                      if id_minimo <= id_factura <= id_maximo]
+        # Primero los que ya están en memoria
+        candidatos.sort(key=lambda mes: mes not in self._segmentos)
+        for mes in candidatos:
+            for factura in self.segmento(mes):
+                if factura.id == id_factura:
+                    return factura
+        return None
+
+    def siguiente_id(self):
+        return max((entrada[2] for entrada in self._indice.values()), default=0) + 1
+
+    def indice(self, mes):
+        """(total, id mínimo, id máximo) de un segmento"""
+        return tuple(self._indice[mes])
+
+    def marcar_guardado(self):
+        self.modificados.clear()
+        self._liberar_historicos()
+
+    def __getstate__(self):
+        # En el snapshot solo va la ventana activa; el cargador se enlaza al cargar
+        estado = self.__dict__.copy()
+        estado['cargador'] = None
+        del estado['_lock']
+        estado['_segmentos'] = {mes: facturas for mes, facturas in self._segmentos.items()
+                                if mes not in self._historicos or mes in self.modificados}
+        estado['_historicos'] = OrderedDict((mes, None) for mes in self._historicos if mes in self.modificados)
+        return estado
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self._lock = threading.RLock()
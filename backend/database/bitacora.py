@@ -0,0 +1,55 @@
+import json
+import os
+import threading
+
+
+class Bitacora:
+    """Registro append-only de operaciones (una línea JSON por mutación)"""
+
+    def __init__(self, ruta, sincronizar=True):
+        self.ruta = ruta
+        self.sincronizar = sincronizar  # fsync después de cada registro
+        self.lock = threading.Lock()
+        self.pendientes = self._contar_registros()
+
+    def _contar_registros(self):
+        """Contar los registros que todavía no se han compactado"""
+        if not os.path.exists(self.ruta):
+            return 0
+        with open(self.ruta, 'rb') as f:
+            return sum(1 for linea in f if linea.strip())
+
+    def agregar(self, op, datos):
+        """Agregar un registro al final de la bitácora"""
+        linea = json.dumps({'op': op, 'datos': datos}, ensure_ascii=False, separators=(',', ':'))
+        with self.lock:
+            with open(self.ruta, 'a', encoding='utf-8') as f:
+                f.write(linea + '\n')
+                f.flush()
+                if self.sincronizar:
+                    os.fsync(f.fileno())
+            self.pendientes += 1
+
+    def leer(self):
+        """Iterar los registros en el orden en que fueron escritos"""
+        if not os.path.exists(self.ruta):
+            return
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    yield json.loads(linea)
+                except ValueError:
+                    # Una línea cortada por una caída a medio escribir: lo anterior sigue siendo válido
+                    print(f" Registro de bitácora corrupto ignorado: {linea[:80]}")
+                    return
+
+    def truncar(self):
+        """Vaciar la bitácora después de un checkpoint"""
+        with self.lock:
+            with open(self.ruta, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self.pendientes = 0
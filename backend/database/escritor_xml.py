@@ -0,0 +1,107 @@
+import os
+import stat
+import tempfile
+from xml.sax.saxutils import escape
+
+# minidom también escapa las comillas dobles en texto y atributos
+_ENTIDADES = {'"': '&quot;'}
+
+# umask del proceso (solo se puede leer cambiándola): se consulta una vez al importar
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def ajustar_permisos(ruta_temporal, ruta):
+    """
+    Dar al temporal los permisos del archivo que va a reemplazar, o los que
+    le daría open() si es nuevo: mkstemp lo crea con 0600.
+    """
+    try:
+        modo = stat.S_IMODE(os.stat(ruta).st_mode)
+    except FileNotFoundError:
+        modo = 0o666 & ~_UMASK
+    os.chmod(ruta_temporal, modo)
+
+
+class EscritorXML:
+    """
+    Serializador XML en streaming: escribe cada elemento directamente a un
+    archivo temporal y al cerrar lo reemplaza de forma atómica.
+    Produce el mismo formato que minidom.toprettyxml(indent="  ").
+    """
+
+    def __init__(self, ruta, raiz, indentar=True):
+        self.ruta = ruta
+        self.raiz = raiz
+        self.indentar = indentar
+        self._archivo = None
+        self._ruta_temporal = None
+        self._pila = []
+        self._pendiente = False  # El último elemento abierto aún no tiene hijos
+
+    def __enter__(self):
+        directorio = os.path.dirname(os.path.abspath(self.ruta))
+        fd, self._ruta_temporal = tempfile.mkstemp(dir=directorio, prefix='.', suffix='.tmp')
+        self._archivo = os.fdopen(fd, 'w', encoding='utf-8')
+        self._archivo.write('<?xml version="1.0" ?>\n' if self.indentar else '<?xml version="1.0" ?>')
+        self.abrir(self.raiz)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.cerrar()
+                self._archivo.flush()
+                os.fsync(self._archivo.fileno())
+            self._archivo.close()
+            if exc_type is None:
+                ajustar_permisos(self._ruta_temporal, self.ruta)
+                os.replace(self._ruta_temporal, self.ruta)
+        finally:
+            if os.path.exists(self._ruta_temporal):
+                os.remove(self._ruta_temporal)
+        return False
+
+    def _sangria(self):
+        return '  ' * len(self._pila) if self.indentar else ''
+
+    def _fin_linea(self):
+        return '\n' if self.indentar else ''
+
+    def _cerrar_apertura(self):
+        """Terminar la etiqueta de apertura del padre antes de escribir un hijo"""
+        if self._pendiente:
+            self._archivo.write('>' + self._fin_linea())
+            self._pendiente = False
+
+    @staticmethod
+    def _atributos(atributos):
+        if not atributos:
+            return ''
+        return ''.join(f' {nombre}="{escape(str(valor), _ENTIDADES)}"'
+                       for nombre, valor in atributos.items())
+
+    def abrir(self, tag, atributos=None):
+        """Abrir un elemento que tendrá hijos"""
+        self._cerrar_apertura()
+        self._archivo.write(f"{self._sangria()}<{tag}{self._atributos(atributos)}")
+        self._pila.append(tag)
+        self._pendiente = True
+
+    def cerrar(self):
+        """Cerrar el último elemento abierto"""
+        tag = self._pila.pop()
+        if self._pendiente:
+            self._archivo.write('/>' + self._fin_linea())
+            self._pendiente = False
+        else:
+            self._archivo.write(f"{self._sangria()}</{tag}>{self._fin_linea()}")
+
+    def elemento(self, tag, texto=None, atributos=None):
+        """Escribir un elemento hoja con texto"""
+        self._cerrar_apertura()
+        apertura = f"{self._sangria()}<{tag}{self._atributos(atributos)}"
+        if texto is None or texto == '':
+            self._archivo.write(f"{apertura}/>{self._fin_linea()}")
+        else:
+            self._archivo.write(f"{apertura}>{escape(str(texto), _ENTIDADES)}</{tag}>{self._fin_linea()}")
@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+class PersistenciaDiferida:
+    """
+    Guardado en segundo plano (write-behind) con group commit.
+
+    Las peticiones solo notifican que el db cambió; un hilo junta las ráfagas y
+    hace un único guardar_cambios cada `intervalo_ms` o al llegar a `max_cambios`.
+
+    Niveles de durabilidad:
+    - 'sincrona': se guarda dentro de la misma petición (comportamiento original)
+    - 'agrupada': la petición responde sin esperar; se pueden perder hasta
+      `intervalo_ms` de cambios si el proceso muere sin pasar por detener()
+    """
+
+    DURABILIDADES = ('sincrona', 'agrupada')
+
+    def __init__(self, manager, db, durabilidad='agrupada', intervalo_ms=200, max_cambios=100):
+        if durabilidad not in self.DURABILIDADES:
+            raise ValueError(f"Durabilidad inválida: {durabilidad}. Use: {', '.join(self.DURABILIDADES)}")
+        self.manager = manager
+        self.db = db
+        self.durabilidad = durabilidad
+        self.intervalo = intervalo_ms / 1000.0
+        self.max_cambios = max_cambios
+        self.pendientes = 0
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._detenido = False
+
+    def notificar(self):
+        """Avisar que hubo una mutación en el db"""
+        if self.durabilidad == 'sincrona':
+            self.flush()
+            return
+
+        with self._condicion:
+            self.pendientes += 1
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name="persistencia-diferida", daemon=True)
+                self._hilo.start()
+            if self.pendientes >= self.max_cambios:
+                self._condicion.notify()
+
+    def _ciclo(self):
+        while True:
+            with self._condicion:
+                while self.pendientes == 0 and not self._detenido:
+                    self._condicion.wait()
+                if self._detenido:
+                    return
+                # Dar tiempo a que llegue el resto de la ráfaga
+                limite = time.monotonic() + self.intervalo
+                while self.pendientes < self.max_cambios and not self._detenido:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._condicion.wait(restante)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f" Error en el guardado diferido: {e}")
+                # Los cambios siguen marcados en el manager: reintentar en el próximo ciclo
+                with self._condicion:
+                    self.pendientes += 1
+                time.sleep(self.intervalo)
+
+    def flush(self):
+        """Guardar ya los cambios pendientes"""
+        with self.manager.lock:
+            with self._condicion:
+                self.pendientes = 0
+            self.manager.guardar_cambios(self.db)
+
+    def detener(self):
+        """Hacer el último flush y terminar el hilo (para el apagado)"""
+        with self._condicion:
+            self._detenido = True
+            self._condicion.notify()
+        if self._hilo is not None:
+            self._hilo.join()
+        with self.manager.lock:
+            with self._condicion:
+                self.pendientes = 0
+            # Último guardado: además deja el snapshot listo para el próximo arranque
+            self.manager.checkpoint(self.db)
@@ -0,0 +1,188 @@
+class ColeccionIndexada(list):
+    """
+    Lista de modelos con un índice hash por clave primaria (`id` o `nit`).
+    Se usa igual que una lista; buscar() y existe() son O(1).
+    `compuestos` agrega índices únicos por varios atributos, p. ej.
+    {'cliente': ('nit_cliente', 'id')}, que se consultan con buscar_por().
+    `grupos` agrega índices secundarios (no únicos) por un atributo, p. ej.
+    {'configuracion': 'id_configuracion'}, que se consultan con agrupados().
+    Un grupo también puede ser (lista, atributo) para indexar por cada
+    elemento de una lista anidada, p. ej. ('recursos', 'id_recurso').
+    """
+
+    def __init__(self, clave, elementos=(), compuestos=None, grupos=None):
+        super().__init__(elementos)
+        self.clave = clave
+        self.compuestos = compuestos or {}
+        self.grupos = grupos or {}
+        self._indice = {}
+        self._indices_compuestos = {}
+        self._indices_grupos = {}
+        self._reindexar()
+
+    def _reindexar(self):
+        self._indice = {}
+        self._indices_compuestos = {nombre: {} for nombre in self.compuestos}
+        self._indices_grupos = {nombre: {} for nombre in self.grupos}
+        for elemento in self:
+            self._indexar(elemento)
+
+    def _indexar(self, elemento):
+        # Si hubiera claves repetidas gana la primera, como hacía next(...)
+        self._indice.setdefault(getattr(elemento, self.clave), elemento)
+        for nombre, atributos in self.compuestos.items():
+            clave = tuple(getattr(elemento, atributo) for atributo in atributos)
+            self._indices_compuestos[nombre].setdefault(clave, elemento)
+        for nombre, atributo in self.grupos.items():
+            if isinstance(atributo, tuple):
+                lista, subatributo = atributo
+                valores = dict.fromkeys(getattr(item, subatributo) for item in getattr(elemento, lista))
+            else:
+                valores = (getattr(elemento, atributo),)
+            for valor in valores:
+                self._indices_grupos[nombre].setdefault(valor, []).append(elemento)
+
+    def buscar(self, valor):
+        return self._indice.get(valor)
+
+    def existe(self, valor):
+        return valor in self._indice
+
+    def buscar_por(self, nombre, *valores):
+        """Buscar en el índice compuesto `nombre` (valores en el orden de sus atributos)"""
+        return self._indices_compuestos[nombre].get(valores)
+
+    def agrupados(self, nombre, valor):
+        """Elementos cuyo atributo del grupo `nombre` vale `valor` (lista vacía si no hay)"""
+        return self._indices_grupos[nombre].get(valor, [])
+
+    def append(self, elemento):
+        super().append(elemento)
+        self._indexar(elemento)
+
+    def extend(self, elementos):
+        for elemento in elementos:
+            self.append(elemento)
+
+    def __iadd__(self, elementos):
+        self.extend(elementos)
+        return self
+
+    def insert(self, posicion, elemento):
+        super().insert(posicion, elemento)
+        self._reindexar()
+
+    def clear(self):
+        super().clear()
+        self._reindexar()
+
+    def remove(self, elemento):
+        super().remove(elemento)
+        self._reindexar()
+
+    def pop(self, *args):
+        elemento = super().pop(*args)
+        self._reindexar()
+        return elemento
+
+    def __setitem__(self, posicion, valor):
+        super().__setitem__(posicion, valor)
+        self._reindexar()
+
+    def __delitem__(self, posicion):
+        super().__delitem__(posicion)
+        self._reindexar()
+
+    def __reduce__(self):
+        return (self.__class__, (self.clave, list(self), self.compuestos, self.grupos))
+
+
+class Repositorio(dict):
+    """
+    El db de la aplicación: mismo dict de colecciones de siempre, pero las
+    colecciones con clave primaria quedan indexadas (db['clientes'].buscar(nit)).
+    Asignar una lista nueva a una de ellas la vuelve a indexar.
+
+    También mantiene índices secundarios: instancias por configuración,
+    configuraciones por categoría, instancias por categoría y configuraciones
+    por recurso (para saber qué costos cambian con un precio). El de recursos
+    se arma con las líneas que tiene la configuración al agregarla a
+    db['configuraciones']: no deben cambiar después (la configuración se arma
+    completa y luego se inserta).
+
+    `version` sube con cada cambio que altera lo que se facturaría (consumos,
+    precios, configuraciones, instancias, facturas emitidas); sirve de clave
+    para los resultados guardados en caché.
+    """
+
+    CLAVES = {
+        'recursos': 'id',
+        'categorias': 'id',
+        'configuraciones': 'id',
+        'clientes': 'nit',
+        'instancias': 'id'
+    }
+
+    COMPUESTOS = {
+        # Los consumos llegan identificados por (nitCliente, idInstancia)
+        'instancias': {'cliente': ('nit_cliente', 'id')}
+    }
+
+    GRUPOS = {
+        'instancias': {'configuracion': 'id_configuracion'},
+        # 'recurso' se indexa al insertar: configuracion.recursos no debe cambiar después
+        'configuraciones': {'categoria': 'id_categoria', 'recurso': ('recursos', 'id_recurso')}
+    }
+
+    def __init__(self, datos=None):
+        super().__init__()
+        self.version = 0
+        for coleccion, elementos in (datos or {}).items():
+            self[coleccion] = elementos
+
+    def __setitem__(self, coleccion, elementos):
+        clave = self.CLAVES.get(coleccion)
+        if clave and not isinstance(elementos, ColeccionIndexada):
+            elementos = ColeccionIndexada(clave, elementos, self.COMPUESTOS.get(coleccion), self.GRUPOS.get(coleccion))
+        super().__setitem__(coleccion, elementos)
+
+    def nueva_version(self):
+        self.version += 1
+        return self.version
+
+    def instancias_de_configuracion(self, id_configuracion):
+        return self['instancias'].agrupados('configuracion', id_configuracion)
+
+    def configuraciones_de_categoria(self, id_categoria):
+        return self['configuraciones'].agrupados('categoria', id_categoria)
+
+    def instancias_de_categoria(self, id_categoria):
+        return [instancia
+                for configuracion in self.configuraciones_de_categoria(id_categoria)
+                for instancia in self.instancias_de_configuracion(configuracion.id)]
+
+    def configuraciones_de_recurso(self, id_recurso):
+        return self['configuraciones'].agrupados('recurso', id_recurso)
+
+    def actualizar_valor_recurso(self, id_recurso, valor_x_hora):
+        """
+        Cambiar el precio de un recurso y recalcular solo el costo por hora de
+        las configuraciones que lo usan. Devuelve esas configuraciones.
+        """
+        recurso = self['recursos'].buscar(id_recurso)
+        if recurso is None:
+            return []
+        recurso.valor_x_hora = valor_x_hora
+        afectadas = self.configuraciones_de_recurso(id_recurso)
+        for configuracion in afectadas:
+            configuracion.calcular_costo_hora(self['recursos'])
+        self.nueva_version()
+        return afectadas
+
+    def categoria_de_configuracion(self, id_configuracion):
+        """Categoría a la que pertenece una configuración (None si alguna no existe)"""
+        configuracion = self['configuraciones'].buscar(id_configuracion)
+        return self['categorias'].buscar(configuracion.id_categoria) if configuracion else None
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
@@ -0,0 +1,533 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import partial
+from urllib.request import pathname2url
+from database.archivo_facturas import ArchivoFacturas, mes_de_factura
+from database.repositorio import Repositorio
+from models.recurso import Recurso
+from models.categoria import Categoria
+from models.configuracion import Configuracion, RecursoConfiguracion
+from models.cliente import Cliente
+from models.instancia import Instancia, Consumo, MINUTOS_DIA, acumular_diarios
+from models.factura import Factura, DetalleFactura
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS recursos (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT, abreviatura TEXT, metrica TEXT, tipo TEXT,
+    valor_x_hora REAL
+);
+CREATE TABLE IF NOT EXISTS categorias (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT, descripcion TEXT, carga_trabajo TEXT
+);
+CREATE TABLE IF NOT EXISTS configuraciones (
+    id INTEGER PRIMARY KEY,
+    id_categoria INTEGER NOT NULL,
+    nombre TEXT, descripcion TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_configuraciones_categoria ON configuraciones (id_categoria);
+CREATE TABLE IF NOT EXISTS recursos_configuracion (
+    id_configuracion INTEGER NOT NULL,
+    posicion INTEGER NOT NULL,
+    id_recurso INTEGER NOT NULL,
+    cantidad REAL,
+    PRIMARY KEY (id_configuracion, posicion)
+);
+CREATE INDEX IF NOT EXISTS idx_recursos_configuracion_recurso ON recursos_configuracion (id_recurso);
+CREATE TABLE IF NOT EXISTS clientes (
+    nit TEXT PRIMARY KEY,
+    nombre TEXT, usuario TEXT, clave TEXT, direccion TEXT, correo_electronico TEXT
+);
+CREATE TABLE IF NOT EXISTS instancias (
+    id INTEGER PRIMARY KEY,
+    nit_cliente TEXT NOT NULL,
+    id_configuracion INTEGER NOT NULL,
+    nombre TEXT, fecha_inicio TEXT, estado TEXT, fecha_final TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_instancias_cliente ON instancias (nit_cliente);
+CREATE INDEX IF NOT EXISTS idx_instancias_configuracion ON instancias (id_configuracion);
+CREATE TABLE IF NOT EXISTS consumos (
+    id_instancia INTEGER NOT NULL,
+    marca INTEGER NOT NULL,
+    tiempo REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_consumos_instancia_marca ON consumos (id_instancia, marca);
+CREATE TABLE IF NOT EXISTS consumos_diarios (
+    id_instancia INTEGER NOT NULL,
+    dia INTEGER NOT NULL,
+    horas REAL NOT NULL,
+    PRIMARY KEY (id_instancia, dia)
+);
+CREATE TABLE IF NOT EXISTS facturas (
+    id INTEGER PRIMARY KEY,
+    nit_cliente TEXT NOT NULL,
+    fecha_emision TEXT, periodo TEXT, monto_total REAL,
+    mes TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_facturas_cliente ON facturas (nit_cliente);
+CREATE INDEX IF NOT EXISTS idx_facturas_mes ON facturas (mes);
+CREATE TABLE IF NOT EXISTS detalles_factura (
+    id_factura INTEGER NOT NULL,
+    posicion INTEGER NOT NULL,
+    id_instancia INTEGER NOT NULL,
+    tiempo_total REAL, monto REAL,
+    PRIMARY KEY (id_factura, posicion)
+);
+CREATE INDEX IF NOT EXISTS idx_detalles_factura_instancia ON detalles_factura (id_instancia);
+"""
+
+
+class SQLiteManager:
+    """
+    Almacenamiento en SQLite con la misma interfaz que XMLManager
+    (guardar_*/cargar_*, registrar, guardar_cambios, cargar_todo...).
+    Los cambios marcados se guardan como upserts de filas sueltas.
+    """
+
+    def __init__(self, ruta="data/nube.db", meses_facturas_activos=3, max_segmentos_historicos=4):
+        self.ruta = ruta
+        self.meses_facturas_activos = meses_facturas_activos
+        self.max_segmentos_historicos = max_segmentos_historicos
+        directorio = os.path.dirname(ruta)
+        if directorio and not os.path.exists(directorio):
+            os.makedirs(directorio)
+        # Una sola conexión compartida entre hilos, serializada con el lock
+        self.lock = threading.RLock()
+        self.conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.executescript(ESQUEMA)
+        self._anidadas = 0  # Transacciones abiertas dentro de la actual
+        self._migrar_diarios()
+        self.cambios = {}
+
+    def __getstate__(self):
+        # En otro proceso (facturación paralela) solo se leen consumos: no viaja la conexión
+        return {'ruta': self.ruta, 'meses_facturas_activos': self.meses_facturas_activos,
+                'max_segmentos_historicos': self.max_segmentos_historicos}
+
+    def __setstate__(self, estado):
+        self.__dict__.update(estado)
+        self.lock = threading.RLock()
+        # Solo lectura: sin esquema ni migraciones, que son cosa del proceso principal
+        uri = 'file:' + pathname2url(os.path.abspath(self.ruta)) + '?mode=ro'
+        self.conexion = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._anidadas = 0
+        self.cambios = {}
+
+    @contextmanager
+    def _transaccion(self):
+        """
+        Transacción con el lock tomado. Si ya hay una abierta (guardar_cambios o
+        guardar_todo llamando a guardar_*), se une a ella: solo la más externa confirma.
+        """
+        with self.lock:
+            if self._anidadas:
+                self._anidadas += 1
+                try:
+                    yield
+                finally:
+                    self._anidadas -= 1
+                return
+            self._anidadas = 1
+            try:
+                with self.conexion:
+                    yield
+            finally:
+                self._anidadas = 0
+
+    # ==================== RECURSOS ====================
+
+    def _upsert_recurso(self, recurso):
+        self.conexion.execute(
+            """INSERT INTO recursos (id, nombre, abreviatura, metrica, tipo, valor_x_hora)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET nombre=excluded.nombre, abreviatura=excluded.abreviatura,
+                   metrica=excluded.metrica, tipo=excluded.tipo, valor_x_hora=excluded.valor_x_hora""",
+            (recurso.id, recurso.nombre, recurso.abreviatura, recurso.metrica, recurso.tipo, recurso.valor_x_hora)
+        )
+
+    def guardar_recursos(self, recursos):
+        """Reemplazar la tabla de recursos por la lista dada"""
+        with self._transaccion():
+            self.conexion.execute("DELETE FROM recursos")
+            for recurso in recursos:
+                self._upsert_recurso(recurso)
+
+    def iterar_recursos(self):
+        """Recursos en el orden en que se guardaron"""
+        with self.lock:
+            filas = self.conexion.execute(
+                "SELECT id, nombre, abreviatura, metrica, tipo, valor_x_hora FROM recursos ORDER BY rowid"
+            ).fetchall()
+        for id_recurso, nombre, abreviatura, metrica, tipo, valor_x_hora in filas:
+            yield Recurso(id_recurso, nombre, abreviatura, metrica, tipo, valor_x_hora)
+
+    # ==================== CATEGORÍAS ====================
+
+    def _upsert_categoria(self, categoria):
+        self.conexion.execute(
+            """INSERT INTO categorias (id, nombre, descripcion, carga_trabajo) VALUES (?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET nombre=excluded.nombre, descripcion=excluded.descripcion,
+                   carga_trabajo=excluded.carga_trabajo""",
+            (categoria.id, categoria.nombre, categoria.descripcion, categoria.carga_trabajo)
+        )
+        for config in categoria.configuraciones:
+            self.conexion.execute(
+                """INSERT INTO configuraciones (id, id_categoria, nombre, descripcion) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET id_categoria=excluded.id_categoria, nombre=excluded.nombre,
+                       descripcion=excluded.descripcion""",
+                (config.id, categoria.id, config.nombre, config.descripcion)
+            )
+            self.conexion.execute("DELETE FROM recursos_configuracion WHERE id_configuracion = ?", (config.id,))
+            self.conexion.executemany(
+                "INSERT INTO recursos_configuracion (id_configuracion, posicion, id_recurso, cantidad) VALUES (?, ?, ?, ?)",
+                [(config.id, n, rc.id_recurso, rc.cantidad) for n, rc in enumerate(config.recursos)]
+            )
+
+    def guardar_categorias(self, categorias):
+        """Reemplazar categorías y configuraciones por la lista dada"""
+        with self._transaccion():
+            self.conexion.execute("DELETE FROM recursos_configuracion")
+            self.conexion.execute("DELETE FROM configuraciones")
+            self.conexion.execute("DELETE FROM categorias")
+            for categoria in categorias:
+                self._upsert_categoria(categoria)
+
+    def iterar_categorias(self):
+        """Categorías con sus configuraciones (y las líneas de recursos) ya enlazadas"""
+        with self.lock:
+            categorias = self.conexion.execute(
+                "SELECT id, nombre, descripcion, carga_trabajo FROM categorias ORDER BY rowid"
+            ).fetchall()
+            configs = self.conexion.execute(
+                "SELECT id, id_categoria, nombre, descripcion FROM configuraciones ORDER BY rowid"
+            ).fetchall()
+            lineas = self.conexion.execute(
+                "SELECT id_configuracion, id_recurso, cantidad FROM recursos_configuracion "
+                "ORDER BY id_configuracion, posicion"
+            ).fetchall()
+
+        recursos_por_config = {}
+        for id_config, id_recurso, cantidad in lineas:
+            recursos_por_config.setdefault(id_config, []).append(RecursoConfiguracion(id_recurso, cantidad))
+
+        configs_por_categoria = {}
+        for id_config, id_categoria, nombre, descripcion in configs:
+            configuracion = Configuracion(id_config, nombre, descripcion, id_categoria)
+            for recurso_config in recursos_por_config.get(id_config, []):
+                configuracion.agregar_recurso(recurso_config)
+            configs_por_categoria.setdefault(id_categoria, []).append(configuracion)
+
+        for id_categoria, nombre, descripcion, carga_trabajo in categorias:
+            categoria = Categoria(id_categoria, nombre, descripcion, carga_trabajo)
+            for configuracion in configs_por_categoria.get(id_categoria, []):
+                categoria.agregar_configuracion(configuracion)
+            yield categoria
+
+    # ==================== CLIENTES ====================
+
+    def _upsert_cliente(self, cliente):
+        self.conexion.execute(
+            """INSERT INTO clientes (nit, nombre, usuario, clave, direccion, correo_electronico)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(nit) DO UPDATE SET nombre=excluded.nombre, usuario=excluded.usuario,
+                   clave=excluded.clave, direccion=excluded.direccion,
+                   correo_electronico=excluded.correo_electronico""",
+            (cliente.nit, cliente.nombre, cliente.usuario, cliente.clave, cliente.direccion, cliente.correo_electronico)
+        )
+        self.conexion.executemany(
+            """INSERT INTO instancias (id, nit_cliente, id_configuracion, nombre, fecha_inicio, estado, fecha_final)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET nit_cliente=excluded.nit_cliente,
+                   id_configuracion=excluded.id_configuracion, nombre=excluded.nombre,
+                   fecha_inicio=excluded.fecha_inicio, estado=excluded.estado, fecha_final=excluded.fecha_final""",
+            [(i.id, cliente.nit, i.id_configuracion, i.nombre, i.fecha_inicio, i.estado, i.fecha_final)
+             for i in cliente.instancias]
+        )
+
+    def guardar_clientes(self, clientes, nits=None):
+        """Guardar clientes; con `nits` solo se hace upsert de esos clientes"""
+        with self._transaccion():
+            if nits:
+                for nit in nits:
+                    cliente = clientes.buscar(nit)
+                    if cliente:
+                        self._upsert_cliente(cliente)
+                return
+            self.conexion.execute("DELETE FROM instancias")
+            self.conexion.execute("DELETE FROM clientes")
+            for cliente in clientes:
+                self._upsert_cliente(cliente)
+
+    def iterar_clientes(self):
+        """Clientes con sus instancias ya enlazadas"""
+        with self.lock:
+            clientes = self.conexion.execute(
+                "SELECT nit, nombre, usuario, clave, direccion, correo_electronico FROM clientes ORDER BY rowid"
+            ).fetchall()
+            instancias = self.conexion.execute(
+                "SELECT id, nit_cliente, id_configuracion, nombre, fecha_inicio, estado, fecha_final "
+                "FROM instancias ORDER BY rowid"
+            ).fetchall()
+
+        instancias_por_cliente = {}
+        for id_instancia, nit_cliente, id_configuracion, nombre, fecha_inicio, estado, fecha_final in instancias:
+            instancia = Instancia(id_instancia, id_configuracion, nombre, fecha_inicio, nit_cliente)
+            instancia.estado = estado or 'Vigente'
+            instancia.fecha_final = fecha_final
+            instancias_por_cliente.setdefault(nit_cliente, []).append(instancia)
+
+        for nit, nombre, usuario, clave, direccion, correo_electronico in clientes:
+            cliente = Cliente(nit, nombre, usuario, clave, direccion, correo_electronico)
+            for instancia in instancias_por_cliente.get(nit, []):
+                cliente.agregar_instancia(instancia)
+            yield cliente
+
+    # ==================== CONSUMOS ====================
+
+    def agregar_consumos(self, registrados):
+        """Persistir consumos nuevos, recibidos como pares (instancia, consumo), y su acumulado diario"""
+        por_instancia = {}
+        for instancia, consumo in registrados:
+            por_instancia.setdefault(instancia.id, []).append(consumo)
+        with self._transaccion():
+            self.conexion.executemany(
+                "INSERT INTO consumos (id_instancia, marca, tiempo) VALUES (?, ?, ?)",
+                [(instancia.id, consumo.marca, consumo.tiempo)
+                 for instancia, consumo in registrados if consumo.marca is not None]
+            )
+            self.conexion.executemany(
+                "INSERT INTO consumos_diarios (id_instancia, dia, horas) VALUES (?, ?, ?) "
+                "ON CONFLICT (id_instancia, dia) DO UPDATE SET horas = horas + excluded.horas",
+                [(id_instancia, dia, horas)
+                 for id_instancia, consumos in por_instancia.items()
+                 for dia, horas in acumular_diarios(consumos).items()]
+            )
+
+    def leer_diarios(self, id_instancia):
+        """Horas por día de una instancia, sin leer sus consumos"""
+        with self.lock:
+            filas = self.conexion.execute(
+                "SELECT dia, horas FROM consumos_diarios WHERE id_instancia = ?", (id_instancia,)
+            ).fetchall()
+        return dict(filas)
+
+    def _migrar_diarios(self):
+        """Armar el acumulado diario de una base creada antes de que existiera"""
+        with self._transaccion():
+            if self.conexion.execute("SELECT 1 FROM consumos_diarios LIMIT 1").fetchone():
+                return
+            self.conexion.execute(
+                "INSERT INTO consumos_diarios (id_instancia, dia, horas) "
+                "SELECT id_instancia, marca / ?, SUM(tiempo) FROM consumos GROUP BY id_instancia, marca / ?",
+                (MINUTOS_DIA, MINUTOS_DIA)
+            )
+
+    def leer_consumos(self, id_instancia):
+        """Consumos de una instancia en el orden en que llegaron"""
+        with self.lock:
+            filas = self.conexion.execute(
+                "SELECT marca, tiempo FROM consumos WHERE id_instancia = ? ORDER BY rowid", (id_instancia,)
+            ).fetchall()
+        return [Consumo(tiempo, marca=marca) for marca, tiempo in filas]
+
+    def eliminar_consumos(self):
+        """Borrar todos los consumos guardados"""
+        with self._transaccion():
+            self.conexion.execute("DELETE FROM consumos")
+            self.conexion.execute("DELETE FROM consumos_diarios")
+
+    # ==================== FACTURAS ====================
+
+    def _upsert_factura(self, factura):
+        self.conexion.execute(
+            """INSERT INTO facturas (id, nit_cliente, fecha_emision, periodo, monto_total, mes)
+               VALUES (?, ?, ?, ?, ?, ?)
+               ON CONFLICT(id) DO UPDATE SET nit_cliente=excluded.nit_cliente, fecha_emision=excluded.fecha_emision,
+                   periodo=excluded.periodo, monto_total=excluded.monto_total, mes=excluded.mes""",
+            (factura.id, factura.nit_cliente, factura.fecha_emision, factura.periodo, factura.monto_total,
+             mes_de_factura(factura))
+        )
+        self.conexion.execute("DELETE FROM detalles_factura WHERE id_factura = ?", (factura.id,))
+        self.conexion.executemany(
+            "INSERT INTO detalles_factura (id_factura, posicion, id_instancia, tiempo_total, monto) VALUES (?, ?, ?, ?, ?)",
+            [(factura.id, n, d.id_instancia, d.tiempo_total, d.monto) for n, d in enumerate(factura.detalles)]
+        )
+
+    def guardar_facturas(self, facturas, ids=None):
+        """Guardar facturas; con `ids` solo se hace upsert de esas facturas"""
+        with self._transaccion():
+            if ids:
+                for id_factura in ids:
+                    factura = facturas.buscar(id_factura)
+                    if factura:
+                        self._upsert_factura(factura)
+            else:
+                self.conexion.execute("DELETE FROM detalles_factura")
+                self.conexion.execute("DELETE FROM facturas")
+                for factura in facturas:
+                    self._upsert_factura(factura)
+        if isinstance(facturas, ArchivoFacturas):
+            facturas.marcar_guardado()
+
+    def _cargar_facturas_mes(self, mes):
+        """Facturas (con detalles) de un mes de emisión"""
+        with self.lock:
+            filas = self.conexion.execute(
+                "SELECT id, nit_cliente, fecha_emision, periodo, monto_total FROM facturas "
+                "WHERE mes = ? ORDER BY rowid", (mes,)
+            ).fetchall()
+            detalles = self.conexion.execute(
+                "SELECT d.id_factura, d.id_instancia, d.tiempo_total, d.monto FROM detalles_factura d "
+                "JOIN facturas f ON f.id = d.id_factura WHERE f.mes = ? ORDER BY d.id_factura, d.posicion", (mes,)
+            ).fetchall()
+
+        detalles_por_factura = {}
+        for id_factura, id_instancia, tiempo_total, monto in detalles:
+            detalles_por_factura.setdefault(id_factura, []).append(DetalleFactura(id_instancia, tiempo_total, monto))
+
+        facturas = []
+        for id_factura, nit_cliente, fecha_emision, periodo, monto_total in filas:
+            factura = Factura(id_factura, nit_cliente, fecha_emision, periodo)
+            factura.detalles = detalles_por_factura.get(id_factura, [])
+            factura.monto_total = monto_total
+            facturas.append(factura)
+        return facturas
+
+    def _cargar_archivo_facturas(self):
+        """Índice de facturas por mes, sin cargar ningún segmento"""
+        facturas = ArchivoFacturas(meses_activos=self.meses_facturas_activos,
+                                   max_historicos=self.max_segmentos_historicos)
+        with self.lock:
+            for mes, total, id_minimo, id_maximo in self.conexion.execute(
+                    "SELECT mes, COUNT(*), MIN(id), MAX(id) FROM facturas GROUP BY mes"):
+                facturas.registrar_segmento(mes, total, id_minimo, id_maximo)
+        return facturas
+
+    # ==================== DB COMPLETO ====================
+
+    def guardar_todo(self, db):
+        """Guardar toda la base de datos"""
+        with self._transaccion():
+            self.guardar_recursos(db['recursos'])
+            self.guardar_categorias(db['categorias'])
+            self.guardar_clientes(db['clientes'])
+            self.guardar_facturas(db['facturas'])
+            self.cambios.clear()
+
+    def importar(self, db, registrados):
+        """Reemplazar todo (db y consumos) en una sola transacción: si falla, no queda nada a medias"""
+        with self._transaccion():
+            self.guardar_todo(db)
+            self.eliminar_consumos()
+            self.agregar_consumos(registrados)
+
+    def marcar_cambio(self, coleccion, clave=None):
+        """Marcar una colección (o solo un registro si se da `clave`) como pendiente de guardar"""
+        if clave is None:
+            self.cambios[coleccion] = None
+        elif coleccion not in self.cambios:
+            self.cambios[coleccion] = {clave}
+        elif self.cambios[coleccion] is not None:
+            self.cambios[coleccion].add(clave)
+
+    def registrar(self, op, datos):
+        """Registrar una mutación del db como cambio pendiente"""
+        if op in ('recurso', 'precio'):
+            self.marcar_cambio('recursos', datos['id'])
+        elif op == 'categoria':
+            self.marcar_cambio('categorias', datos['id'])
+        elif op == 'configuracion':
+            self.marcar_cambio('categorias', datos['idCategoria'])
+        elif op == 'cliente':
+            self.marcar_cambio('clientes', datos['nit'])
+        elif op in ('instancia', 'cancelacion'):
+            self.marcar_cambio('clientes', datos['nitCliente'])
+        elif op == 'factura':
+            self.marcar_cambio('facturas', datos['id'])
+        elif op == 'reset':
+            for coleccion in ('recursos', 'categorias', 'clientes', 'facturas'):
+                self.marcar_cambio(coleccion)
+
+    def guardar_cambios(self, db):
+        """
+        Aplicar los cambios marcados en una sola transacción: upsert de filas
+        sueltas, o la tabla completa si no hay claves
+        """
+        guardadas = []
+        with self.lock:
+            with self._transaccion():
+                for coleccion, claves in list(self.cambios.items()):
+                    if coleccion == 'recursos':
+                        if claves is None:
+                            self.guardar_recursos(db['recursos'])
+                        else:
+                            for id_recurso in claves:
+                                recurso = db['recursos'].buscar(id_recurso)
+                                if recurso:
+                                    self._upsert_recurso(recurso)
+                    elif coleccion == 'categorias':
+                        if claves is None:
+                            self.guardar_categorias(db['categorias'])
+                        else:
+                            for id_categoria in claves:
+                                categoria = db['categorias'].buscar(id_categoria)
+                                if categoria:
+                                    self._upsert_categoria(categoria)
+                    elif coleccion == 'clientes':
+                        self.guardar_clientes(db['clientes'], claves)
+                    elif coleccion == 'facturas':
+                        self.guardar_facturas(db['facturas'], claves)
+                    guardadas.append(coleccion)
+            # Se desmarcan recién confirmada la transacción: si falla, quedan para el próximo flush
+            for coleccion in guardadas:
+                del self.cambios[coleccion]
+        return guardadas
+
+    def checkpoint(self, db):
+        """Guardar lo pendiente (al apagar); SQLite no usa snapshot"""
+        self.guardar_cambios(db)
+
+    def cargar_todo(self):
+        """Cargar toda la base de datos"""
+        try:
+            recursos = list(self.iterar_recursos())
+            categorias = list(self.iterar_categorias())
+            configuraciones = [config for categoria in categorias for config in categoria.configuraciones]
+            clientes = list(self.iterar_clientes())
+            instancias = [instancia for cliente in clientes for instancia in cliente.instancias]
+            for instancia in instancias:
+                instancia.cargador_consumos = partial(self.leer_consumos, instancia.id)
+                instancia.cargador_diarios = partial(self.leer_diarios, instancia.id)
+
+            # Solo se cargan los meses activos; los históricos se consultan cuando se piden
+            facturas = self._cargar_archivo_facturas()
+            facturas.activar(self._cargar_facturas_mes)
+
+            return Repositorio({
+                'recursos': recursos,
+                'categorias': categorias,
+                'clientes': clientes,
+                'configuraciones': configuraciones,
+                'instancias': instancias,
+                'consumos': [],  # Los consumos se leen por instancia bajo demanda
+                'facturas': facturas
+            })
+
+        except Exception as e:
+            print(f" Error cargando datos: {e}")
+
+            return Repositorio({
+                'recursos': [],
+                'categorias': [],
+                'clientes': [],
+                'configuraciones': [],
+                'instancias': [],
+                'consumos': [],
+                'facturas': ArchivoFacturas(meses_activos=self.meses_facturas_activos,
+                                            max_historicos=self.max_segmentos_historicos)
+            })
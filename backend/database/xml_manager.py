@@ -1,450 +1,737 @@
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
 import os
+import gc
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from functools import partial
+from database.almacen_consumos import AlmacenConsumos
+from database.archivo_facturas import ArchivoFacturas
+from database.bitacora import Bitacora
+from database.escritor_xml import EscritorXML, ajustar_permisos
+from database.repositorio import Repositorio
+from models.recurso import Recurso
+from models.categoria import Categoria
+from models.configuracion import Configuracion, RecursoConfiguracion
+from models.cliente import Cliente
+from models.instancia import Instancia
+from models.factura import Factura, DetalleFactura
+
+VERSION_SNAPSHOT = 10
+DIRECTORIO_CLIENTES = "clientes"
+MANIFIESTO_CLIENTES = os.path.join(DIRECTORIO_CLIENTES, "manifiesto.xml")
+DIRECTORIO_FACTURAS = "facturas"
+MANIFIESTO_FACTURAS = os.path.join(DIRECTORIO_FACTURAS, "manifiesto.xml")
+
+
+def _cargar_coleccion(base_path, coleccion, *args):
+    """Parsear una colección (o una partición) en un proceso del pool de carga paralela"""
+    gc.disable()
+    manager = XMLManager(base_path, usar_snapshot=False)
+    return list(getattr(manager, f"iterar_{coleccion}")(*args))
 
 
 class XMLManager:
-    def __init__(self, base_path="data"):
+    def __init__(self, base_path="data", modo_bitacora=False, indentar=True, usar_snapshot=True,
+                 carga_paralela=False, particiones_clientes=0, meses_facturas_activos=3,
+                 max_segmentos_historicos=4, solo_lectura=False):
         self.base_path = base_path
-        self.ensure_directory()
+        # Solo lectura: cargar_todo no migra ni reescribe nada (p. ej. al copiar los datos a SQLite)
+        self.solo_lectura = solo_lectura
+        self.indentar = indentar
+        self.usar_snapshot = usar_snapshot
+        self.carga_paralela = carga_paralela
+        # 0 = un solo clientes.xml; N = clientes repartidos en N archivos por hash del NIT
+        self.particiones_clientes = particiones_clientes
+        # Facturas: un archivo por mes de emisión; solo los meses recientes se cargan al iniciar
+        self.meses_facturas_activos = meses_facturas_activos
+        self.max_segmentos_historicos = max_segmentos_historicos
+        if not solo_lectura:
+            self.ensure_directory()
+        # Protege el db mientras se escribe un checkpoint
+        self.lock = threading.RLock()
+        self.bitacora = Bitacora(os.path.join(base_path, "bitacora.log")) if modo_bitacora else None
+        self._hilo_compactacion = None
+        # Colecciones modificadas desde el último guardado -> claves de los registros tocados
+        self.cambios = {}
+        # El snapshot en disco coincide con los XML (no hace falta reescribirlo al apagar)
+        self._snapshot_vigente = False
+        # Los consumos no van en XML: cada instancia tiene su archivo binario append-only
+        self.almacen_consumos = AlmacenConsumos(os.path.join(base_path, "consumos"), solo_lectura)
 
     def ensure_directory(self):
         """Asegurar que el directorio de datos existe"""
         if not os.path.exists(self.base_path):
             os.makedirs(self.base_path)
+        if self.particiones_clientes:
+            os.makedirs(os.path.join(self.base_path, DIRECTORIO_CLIENTES), exist_ok=True)
+        os.makedirs(os.path.join(self.base_path, DIRECTORIO_FACTURAS), exist_ok=True)
 
     def guardar_recursos(self, recursos):
         """Guardar lista de recursos en XML"""
-        root = ET.Element("listaRecursos")
-
-        for recurso in recursos:
-            recurso_elem = ET.SubElement(root, "recurso")
-            #Acceder a atributos del objeto
-            recurso_elem.set("id", str(recurso.id))  # ← recurso.id, NO recurso['id']
-
-            ET.SubElement(recurso_elem, "nombre").text = recurso.nombre
-            ET.SubElement(recurso_elem, "abreviatura").text = recurso.abreviatura
-            ET.SubElement(recurso_elem, "metrica").text = recurso.metrica
-            ET.SubElement(recurso_elem, "tipo").text = recurso.tipo
-            ET.SubElement(recurso_elem, "valorXhora").text = str(recurso.valor_x_hora)
-
-        self._guardar_xml(root, "recursos.xml")
-
-    def cargar_recursos(self):  # <-- AGREGA ESTE MÉTODO AQUÍ
-        """Cargar recursos desde XML"""
-        try:
-            tree = ET.parse(os.path.join(self.base_path, "recursos.xml"))
-            root = tree.getroot()
-
-            recursos = []
-            for recurso_elem in root.findall('recurso'):
-                recurso = {
-                    'id': int(recurso_elem.get('id')),
-                    'nombre': recurso_elem.find('nombre').text,
-                    'abreviatura': recurso_elem.find('abreviatura').text,
-                    'metrica': recurso_elem.find('metrica').text,
-                    'tipo': recurso_elem.find('tipo').text,
-                    'valorXhora': float(recurso_elem.find('valorXhora').text)
-                }
-                recursos.append(recurso)
-
-            return recursos
-        except FileNotFoundError:
-            return []
+        with self._escritor("recursos.xml", "listaRecursos") as xml:
+            for recurso in recursos:
+                xml.abrir("recurso", {"id": recurso.id})
+                xml.elemento("nombre", recurso.nombre)
+                xml.elemento("abreviatura", recurso.abreviatura)
+                xml.elemento("metrica", recurso.metrica)
+                xml.elemento("tipo", recurso.tipo)
+                xml.elemento("valorXhora", recurso.valor_x_hora)
+                xml.cerrar()
 
     def guardar_categorias(self, categorias):
         """Guardar categorías en XML"""
-        root = ET.Element("listaCategorias")
-
-        for categoria in categorias:
-            categoria_elem = ET.SubElement(root, "categoria")
-            # Acceder a atributos del objeto
-            categoria_elem.set("id", str(categoria.id))
-
-            ET.SubElement(categoria_elem, "nombre").text = categoria.nombre
-            ET.SubElement(categoria_elem, "descripcion").text = categoria.descripcion
-            ET.SubElement(categoria_elem, "cargaTrabajo").text = categoria.carga_trabajo
-
-            lista_configs = ET.SubElement(categoria_elem, "listaConfiguraciones")
-            for config in categoria.configuraciones:  # ← categoria.configuraciones, NO categoria.get('configuraciones')
-                config_elem = ET.SubElement(lista_configs, "configuracion")
-                config_elem.set("id", str(config.id))
-
-                ET.SubElement(config_elem, "nombre").text = config.nombre
-                ET.SubElement(config_elem, "descripcion").text = config.descripcion
-
-                recursos_config = ET.SubElement(config_elem, "recursosConfiguracion")
-                for recurso_config in config.recursos:  # ← config.recursos, NO config.get('recursos')
-                    recurso_elem = ET.SubElement(recursos_config, "recurso")
-                    recurso_elem.set("id", str(recurso_config.id_recurso))
-                    recurso_elem.text = str(recurso_config.cantidad)
-
-        self._guardar_xml(root, "categorias.xml")
-
-    def cargar_categorias(self):
-        """Cargar categorías desde XML"""
-        try:
-            tree = ET.parse(os.path.join(self.base_path, "categorias.xml"))
-            root = tree.getroot()
-
-            categorias = []
-            for categoria_elem in root.findall('categoria'):
-                categoria = {
-                    'id': int(categoria_elem.get('id')),
-                    'nombre': categoria_elem.find('nombre').text,
-                    'descripcion': categoria_elem.find('descripcion').text,
-                    'cargaTrabajo': categoria_elem.find('cargaTrabajo').text,
-                    'configuraciones': []
-                }
-
-                lista_configs = categoria_elem.find('listaConfiguraciones')
-                if lista_configs is not None:
-                    for config_elem in lista_configs.findall('configuracion'):
-                        config = {
-                            'id': int(config_elem.get('id')),
-                            'nombre': config_elem.find('nombre').text,
-                            'descripcion': config_elem.find('descripcion').text,
-                            'recursos': []
-                        }
-
-                        recursos_config = config_elem.find('recursosConfiguracion')
-                        if recursos_config is not None:
-                            for recurso_elem in recursos_config.findall('recurso'):
-                                recurso_config = {
-                                    'idRecurso': int(recurso_elem.get('id')),
-                                    'cantidad': float(recurso_elem.text)
-                                }
-                                config['recursos'].append(recurso_config)
-
-                        categoria['configuraciones'].append(config)
-
-                categorias.append(categoria)
-
-            return categorias
-        except FileNotFoundError:
-            return []
-
-    def guardar_clientes(self, clientes):
-        """Guardar clientes en XML"""
-        root = ET.Element("listaClientes")
-
+        with self._escritor("categorias.xml", "listaCategorias") as xml:
+            for categoria in categorias:
+                xml.abrir("categoria", {"id": categoria.id})
+                xml.elemento("nombre", categoria.nombre)
+                xml.elemento("descripcion", categoria.descripcion)
+                xml.elemento("cargaTrabajo", categoria.carga_trabajo)
+
+                xml.abrir("listaConfiguraciones")
+                for config in categoria.configuraciones:
+                    xml.abrir("configuracion", {"id": config.id})
+                    xml.elemento("nombre", config.nombre)
+                    xml.elemento("descripcion", config.descripcion)
+
+                    xml.abrir("recursosConfiguracion")
+                    for recurso_config in config.recursos:
+                        xml.elemento("recurso", recurso_config.cantidad, {"id": recurso_config.id_recurso})
+                    xml.cerrar()
+                    xml.cerrar()
+                xml.cerrar()
+                xml.cerrar()
+
+    def guardar_clientes(self, clientes, nits=None):
+        """
+        Guardar clientes en XML. Con particiones solo se reescriben las
+        particiones de los `nits` indicados (todas si no se indica ninguno).
+        """
+        if not self.particiones_clientes:
+            self._escribir_clientes("clientes.xml", clientes)
+            return
+
+        por_particion = {}
         for cliente in clientes:
-            cliente_elem = ET.SubElement(root, "cliente")
-            #  Acceder a atributos del objeto
-            cliente_elem.set("nit", cliente.nit)
-
-            ET.SubElement(cliente_elem, "nombre").text = cliente.nombre
-            ET.SubElement(cliente_elem, "usuario").text = cliente.usuario
-            ET.SubElement(cliente_elem, "clave").text = cliente.clave
-            ET.SubElement(cliente_elem, "direccion").text = cliente.direccion
-            ET.SubElement(cliente_elem, "correoElectronico").text = cliente.correo_electronico
-
-            lista_instancias = ET.SubElement(cliente_elem, "listaInstancias")
-            for instancia in cliente.instancias:  # ← cliente.instancias, NO cliente.get('instancias')
-                instancia_elem = ET.SubElement(lista_instancias, "instancia")
-                instancia_elem.set("id", str(instancia.id))
-
-                ET.SubElement(instancia_elem, "idConfiguracion").text = str(instancia.id_configuracion)
-                ET.SubElement(instancia_elem, "nombre").text = instancia.nombre
-                ET.SubElement(instancia_elem, "fechaInicio").text = instancia.fecha_inicio
-                ET.SubElement(instancia_elem, "estado").text = instancia.estado
-
-                if instancia.fecha_final:  # ← instancia.fecha_final, NO instancia['fechaFinal']
-                    ET.SubElement(instancia_elem, "fechaFinal").text = instancia.fecha_final
-
-        self._guardar_xml(root, "clientes.xml")
-
-    def cargar_clientes(self):
-        """Cargar clientes desde XML"""
-        try:
-            tree = ET.parse(os.path.join(self.base_path, "clientes.xml"))
-            root = tree.getroot()
-
-            clientes = []
-            for cliente_elem in root.findall('cliente'):
-                cliente = {
-                    'nit': cliente_elem.get('nit'),
-                    'nombre': cliente_elem.find('nombre').text,
-                    'usuario': cliente_elem.find('usuario').text,
-                    'clave': cliente_elem.find('clave').text,
-                    'direccion': cliente_elem.find('direccion').text,
-                    'correoElectronico': cliente_elem.find('correoElectronico').text,
-                    'instancias': []
-                }
-
-                lista_instancias = cliente_elem.find('listaInstancias')
-                if lista_instancias is not None:
-                    for instancia_elem in lista_instancias.findall('instancia'):
-                        instancia = {
-                            'id': int(instancia_elem.get('id')),
-                            'idConfiguracion': int(instancia_elem.find('idConfiguracion').text),
-                            'nombre': instancia_elem.find('nombre').text,
-                            'fechaInicio': instancia_elem.find('fechaInicio').text,
-                            'estado': instancia_elem.find('estado').text,
-                            'fechaFinal': instancia_elem.find('fechaFinal').text if instancia_elem.find(
-                                'fechaFinal') is not None else None,
-                            'nitCliente': cliente['nit'],
-                            'consumos': []
-                        }
-                        cliente['instancias'].append(instancia)
-
-                clientes.append(cliente)
-
-            return clientes
-        except FileNotFoundError:
-            return []
-
-    def guardar_consumos(self, consumos):
-        """Guardar consumos en XML"""
-        root = ET.Element("listadoConsumos")
-
-        for consumo in consumos:
-            consumo_elem = ET.SubElement(root, "consumo")
-            consumo_elem.set("nitCliente", consumo['nitCliente'])
-            consumo_elem.set("idInstancia", str(consumo['idInstancia']))
-
-            ET.SubElement(consumo_elem, "tiempo").text = str(consumo['tiempo'])
-            ET.SubElement(consumo_elem, "fechahora").text = consumo['fechahora']
-
-        self._guardar_xml(root, "consumos.xml")
-
-    def cargar_consumos(self):
-        """Cargar consumos desde XML"""
-        try:
-            tree = ET.parse(os.path.join(self.base_path, "consumos.xml"))
-            root = tree.getroot()
-
-            consumos = []
-            for consumo_elem in root.findall('consumo'):
-                consumo = {
-                    'nitCliente': consumo_elem.get('nitCliente'),
-                    'idInstancia': int(consumo_elem.get('idInstancia')),
-                    'tiempo': float(consumo_elem.find('tiempo').text),
-                    'fechahora': consumo_elem.find('fechahora').text
-                }
-                consumos.append(consumo)
-
-            return consumos
-        except FileNotFoundError:
-            return []
-
-    def guardar_facturas(self, facturas):
-        """Guardar facturas en XML"""
-        root = ET.Element("listaFacturas")
-
-        for factura in facturas:
-            factura_elem = ET.SubElement(root, "factura")
-            factura_elem.set("id", str(factura.id))
-
-            ET.SubElement(factura_elem, "nitCliente").text = factura.nit_cliente
-            ET.SubElement(factura_elem, "fechaEmision").text = factura.fecha_emision
-            ET.SubElement(factura_elem, "periodo").text = factura.periodo
-            ET.SubElement(factura_elem, "montoTotal").text = str(factura.monto_total)
-
-            detalles_elem = ET.SubElement(factura_elem, "detalles")
-            for detalle in factura.detalles:  # ← factura.detalles, NO factura.get('detalles')
-                detalle_elem = ET.SubElement(detalles_elem, "detalle")
-                ET.SubElement(detalle_elem, "idInstancia").text = str(detalle.id_instancia)
-                ET.SubElement(detalle_elem, "tiempoTotal").text = str(detalle.tiempo_total)
-                ET.SubElement(detalle_elem, "monto").text = str(detalle.monto)
-
-        self._guardar_xml(root, "facturas.xml")
-
-    def cargar_facturas(self):
-        """Cargar facturas desde XML"""
-        try:
-            tree = ET.parse(os.path.join(self.base_path, "facturas.xml"))
-            root = tree.getroot()
-
-            facturas = []
-            for factura_elem in root.findall('factura'):
-                factura = {
-                    'id': int(factura_elem.get('id')),
-                    'nitCliente': factura_elem.find('nitCliente').text,
-                    'fechaEmision': factura_elem.find('fechaEmision').text,
-                    'periodo': factura_elem.find('periodo').text,
-                    'montoTotal': float(factura_elem.find('montoTotal').text),
-                    'detalles': []
-                }
-
-                detalles_elem = factura_elem.find('detalles')
-                if detalles_elem is not None:
-                    for detalle_elem in detalles_elem.findall('detalle'):
-                        detalle = {
-                            'idInstancia': int(detalle_elem.find('idInstancia').text),
-                            'tiempoTotal': float(detalle_elem.find('tiempoTotal').text),
-                            'monto': float(detalle_elem.find('monto').text)
-                        }
-                        factura['detalles'].append(detalle)
-
-                facturas.append(factura)
-
+            por_particion.setdefault(self._particion_cliente(cliente.nit), []).append(cliente)
+
+        if nits and self._particiones_manifiesto() == self.particiones_clientes:
+            particiones = sorted({self._particion_cliente(nit) for nit in nits})
+        else:
+            # Todo, o cambió la cantidad de particiones: los NIT caen en otros
+            # archivos y hay que reescribir todas y borrar las anteriores
+            particiones = range(self.particiones_clientes)
+            self._eliminar_particiones_sobrantes()
+
+        for particion in particiones:
+            self._escribir_clientes(self._archivo_particion(particion), por_particion.get(particion, []))
+        self._guardar_manifiesto_clientes(por_particion)
+
+    def _escribir_clientes(self, filename, clientes):
+        with self._escritor(filename, "listaClientes") as xml:
+            for cliente in clientes:
+                xml.abrir("cliente", {"nit": cliente.nit})
+                xml.elemento("nombre", cliente.nombre)
+                xml.elemento("usuario", cliente.usuario)
+                xml.elemento("clave", cliente.clave)
+                xml.elemento("direccion", cliente.direccion)
+                xml.elemento("correoElectronico", cliente.correo_electronico)
+
+                xml.abrir("listaInstancias")
+                for instancia in cliente.instancias:
+                    xml.abrir("instancia", {"id": instancia.id})
+                    xml.elemento("idConfiguracion", instancia.id_configuracion)
+                    xml.elemento("nombre", instancia.nombre)
+                    xml.elemento("fechaInicio", instancia.fecha_inicio)
+                    xml.elemento("estado", instancia.estado)
+                    if instancia.fecha_final:
+                        xml.elemento("fechaFinal", instancia.fecha_final)
+                    xml.cerrar()
+                xml.cerrar()
+                xml.cerrar()
+
+    # ==================== PARTICIONES DE CLIENTES ====================
+
+    def _particion_cliente(self, nit):
+        """Partición estable entre procesos (hash() de Python cambia en cada ejecución)"""
+        return zlib.crc32(nit.encode('utf-8')) % self.particiones_clientes
+
+    def _archivo_particion(self, particion):
+        return os.path.join(DIRECTORIO_CLIENTES, f"clientes_{particion:03d}.xml")
+
+    def _guardar_manifiesto_clientes(self, por_particion):
+        with self._escritor(MANIFIESTO_CLIENTES, "manifiestoClientes") as xml:
+            xml.abrir("particiones", {"total": self.particiones_clientes})
+            for particion in range(self.particiones_clientes):
+                xml.elemento("particion", None, {
+                    "archivo": os.path.basename(self._archivo_particion(particion)),
+                    "clientes": len(por_particion.get(particion, []))
+                })
+            xml.cerrar()
+
+    def _particiones_manifiesto(self):
+        """Cantidad de particiones con la que se guardaron los clientes (None si no hay manifiesto)"""
+        manifiesto = os.path.join(self.base_path, MANIFIESTO_CLIENTES)
+        if not os.path.exists(manifiesto):
+            return None
+        return int(ET.parse(manifiesto).getroot().find('particiones').get('total'))
+
+    def _eliminar_particiones_sobrantes(self):
+        """Borrar archivos de una cantidad de particiones anterior"""
+        vigentes = {os.path.basename(self._archivo_particion(p)) for p in range(self.particiones_clientes)}
+        directorio = os.path.join(self.base_path, DIRECTORIO_CLIENTES)
+        if not os.path.isdir(directorio):
+            return
+        for nombre in os.listdir(directorio):
+            if nombre.startswith("clientes_") and nombre.endswith(".xml") and nombre not in vigentes:
+                os.remove(os.path.join(directorio, nombre))
+
+    def _archivos_clientes(self):
+        """Archivos de clientes a leer según el manifiesto (o el clientes.xml único)"""
+        # Si hay manifiesto se leen sus particiones aunque la configuración haya cambiado:
+        # son los datos más recientes y _cargar_xml los pasa al formato configurado
+        manifiesto = os.path.join(self.base_path, MANIFIESTO_CLIENTES)
+        if not os.path.exists(manifiesto):
+            return ["clientes.xml"]
+        raiz = ET.parse(manifiesto).getroot()
+        return [os.path.join(DIRECTORIO_CLIENTES, p.get('archivo')) for p in raiz.iter('particion')]
+
+    def _archivos_checkpoint(self):
+        """Archivos que forman un checkpoint del db (los consumos van aparte)"""
+        # Cualquier guardado de facturas reescribe el manifiesto, que basta como firma
+        # (en el snapshot solo van los segmentos activos)
+        archivos = ["recursos.xml", "categorias.xml", MANIFIESTO_FACTURAS]
+        archivos.extend(self._archivos_clientes())
+        if self.particiones_clientes:
+            archivos.append(MANIFIESTO_CLIENTES)
+        return archivos
+
+    # ==================== SEGMENTOS DE FACTURAS ====================
+
+    def _archivo_segmento(self, mes):
+        return os.path.join(DIRECTORIO_FACTURAS, f"facturas_{mes}.xml")
+
+    def _guardar_manifiesto_facturas(self, facturas):
+        with self._escritor(MANIFIESTO_FACTURAS, "manifiestoFacturas") as xml:
+            xml.abrir("segmentos", {"total": len(facturas.meses())})
+            for mes in facturas.meses():
+                total, id_minimo, id_maximo = facturas.indice(mes)
+                xml.elemento("segmento", None, {
+                    "mes": mes,
+                    "archivo": os.path.basename(self._archivo_segmento(mes)),
+                    "facturas": total,
+                    "idMinimo": id_minimo,
+                    "idMaximo": id_maximo
+                })
+            xml.cerrar()
+
+    def _eliminar_segmentos_sobrantes(self, facturas):
+        """Borrar archivos de meses que ya no tienen facturas (p. ej. después de un reset)"""
+        vigentes = {os.path.basename(self._archivo_segmento(mes)) for mes in facturas.meses()}
+        directorio = os.path.join(self.base_path, DIRECTORIO_FACTURAS)
+        for nombre in os.listdir(directorio):
+            if nombre.startswith("facturas_") and nombre.endswith(".xml") and nombre not in vigentes:
+                os.remove(os.path.join(directorio, nombre))
+
+    def _segmentos_facturas(self):
+        """Entradas del manifiesto de facturas, o None si todavía no existe"""
+        manifiesto = os.path.join(self.base_path, MANIFIESTO_FACTURAS)
+        if not os.path.exists(manifiesto):
+            return None
+        return list(ET.parse(manifiesto).getroot().iter('segmento'))
+
+    def _archivos_facturas(self):
+        """Archivos de facturas a leer: los segmentos del manifiesto o el facturas.xml anterior"""
+        segmentos = self._segmentos_facturas()
+        if segmentos is None:
+            return ["facturas.xml"]
+        return [os.path.join(DIRECTORIO_FACTURAS, s.get('archivo')) for s in segmentos]
+
+    def _cargar_segmento_facturas(self, mes):
+        return list(self.iterar_facturas(self._archivo_segmento(mes)))
+
+    def _cargar_archivo_facturas(self):
+        """Índice de segmentos sin cargar ninguno (migra el facturas.xml único si hace falta)"""
+        facturas = ArchivoFacturas(meses_activos=self.meses_facturas_activos,
+                                   max_historicos=self.max_segmentos_historicos)
+        segmentos = self._segmentos_facturas()
+        if segmentos is not None:
+            for segmento in segmentos:
+                facturas.registrar_segmento(segmento.get('mes'), int(segmento.get('facturas')),
+                                            int(segmento.get('idMinimo')), int(segmento.get('idMaximo')))
             return facturas
-        except FileNotFoundError:
-            return []
-
-    def _guardar_xml(self, root, filename):
-        """Guardar XML con formato legible"""
-        rough_string = ET.tostring(root, 'utf-8')
-        reparsed = minidom.parseString(rough_string)
-        pretty_xml = reparsed.toprettyxml(indent="  ")
 
-        with open(os.path.join(self.base_path, filename), 'w', encoding='utf-8') as f:
-            f.write(pretty_xml)
+        facturas.extend(self.iterar_facturas("facturas.xml"))
+        if not self.solo_lectura:
+            self.guardar_facturas(facturas)
+        return facturas
+
+    def guardar_facturas(self, facturas, completo=False):
+        """
+        Guardar facturas en XML, un archivo por mes de emisión. Solo se reescriben
+        los meses modificados, salvo con `completo`.
+        """
+        if not isinstance(facturas, ArchivoFacturas):
+            archivo = ArchivoFacturas(meses_activos=self.meses_facturas_activos,
+                                      max_historicos=self.max_segmentos_historicos)
+            archivo.extend(facturas)
+            facturas = archivo
+
+        meses = facturas.meses() if completo else sorted(facturas.modificados)
+        for mes in meses:
+            self._escribir_facturas(self._archivo_segmento(mes), facturas.segmento(mes))
+        self._guardar_manifiesto_facturas(facturas)
+        self._eliminar_segmentos_sobrantes(facturas)
+        facturas.marcar_guardado()
+
+    def _escribir_facturas(self, filename, facturas):
+        with self._escritor(filename, "listaFacturas") as xml:
+            for factura in facturas:
+                xml.abrir("factura", {"id": factura.id})
+                xml.elemento("nitCliente", factura.nit_cliente)
+                xml.elemento("fechaEmision", factura.fecha_emision)
+                xml.elemento("periodo", factura.periodo)
+                xml.elemento("montoTotal", factura.monto_total)
+
+                xml.abrir("detalles")
+                for detalle in factura.detalles:
+                    xml.abrir("detalle")
+                    xml.elemento("idInstancia", detalle.id_instancia)
+                    xml.elemento("tiempoTotal", detalle.tiempo_total)
+                    xml.elemento("monto", detalle.monto)
+                    xml.cerrar()
+                xml.cerrar()
+                xml.cerrar()
+
+    def _escritor(self, filename, raiz):
+        """Escritor en streaming con reemplazo atómico del archivo"""
+        if self.solo_lectura:
+            raise PermissionError(f"{self.base_path} está abierto en solo lectura")
+        return EscritorXML(os.path.join(self.base_path, filename), raiz, indentar=self.indentar)
 
     def guardar_todo(self, db):
         """Guardar toda la base de datos"""
         self.guardar_recursos(db['recursos'])
         self.guardar_categorias(db['categorias'])
         self.guardar_clientes(db['clientes'])
-        self.guardar_consumos(db['consumos'])
-        self.guardar_facturas(db['facturas'])
+        self.guardar_facturas(db['facturas'], completo=True)
+        self.cambios.clear()
+        if self.usar_snapshot:
+            self.guardar_snapshot(db)
+
+    def marcar_cambio(self, coleccion, clave=None):
+        """
+        Marcar una colección como pendiente de guardar. Con `clave` solo se marca
+        ese registro; sin ella, la colección completa (None en self.cambios).
+        """
+        if clave is None:
+            self.cambios[coleccion] = None
+        elif coleccion not in self.cambios:
+            self.cambios[coleccion] = {clave}
+        elif self.cambios[coleccion] is not None:
+            self.cambios[coleccion].add(clave)
+
+    def guardar_cambios(self, db):
+        """
+        Reescribir solo los archivos de las colecciones marcadas. El snapshot no
+        se reescribe aquí (costaría todo el db en cada flush): los XML más nuevos
+        lo invalidan hasta el próximo checkpoint() o la próxima carga desde XML.
+        """
+        guardadores = {
+            'recursos': lambda: self.guardar_recursos(db['recursos']),
+            'categorias': lambda: self.guardar_categorias(db['categorias']),
+            'clientes': lambda: self.guardar_clientes(db['clientes'], self.cambios['clientes']),
+            'facturas': lambda: self.guardar_facturas(db['facturas'])
+        }
+        guardadas = []
+        for coleccion in list(self.cambios):
+            guardadores[coleccion]()
+            del self.cambios[coleccion]
+            guardadas.append(coleccion)
+        if guardadas:
+            self._snapshot_vigente = False
+        return guardadas
+
+    def checkpoint(self, db):
+        """Guardar lo pendiente y dejar el snapshot al día (al apagar)"""
+        if self.bitacora:
+            # Mismo orden que la compactación periódica: XML, snapshot y recién
+            # entonces se vacía la bitácora, para no reproducirla al arrancar
+            self.compactar(db)
+            return
+        self.guardar_cambios(db)
+        if self.usar_snapshot and not self._snapshot_vigente:
+            self.guardar_snapshot(db)
 
     def cargar_todo(self):
-        """Cargar toda la base de datos - versión funcional"""
+        """Cargar toda la base de datos (desde el snapshot binario si sigue vigente)"""
+        # Se crean cientos de miles de objetos que viven todo el proceso:
+        # el recolector de ciclos solo agregaría pasadas inútiles durante la carga
+        gc.disable()
         try:
-            # Cargar como diccionarios primero
-            recursos_dict = self.cargar_recursos()
-            categorias_dict = self.cargar_categorias()
-            clientes_dict = self.cargar_clientes()
-            facturas_dict = self.cargar_facturas()
-
-            # Convertir a objetos
-            from models.recurso import Recurso
-            from models.categoria import Categoria
-            from models.configuracion import Configuracion, RecursoConfiguracion
-            from models.cliente import Cliente
-            from models.instancia import Instancia, Consumo
-            from models.factura import Factura, DetalleFactura
-
-            # Convertir recursos
-            recursos = []
-            for recurso_data in recursos_dict:
-                recursos.append(Recurso.from_dict(recurso_data))
-
-            # Convertir categorías
-            categorias = []
-            configuraciones = []
-            for categoria_data in categorias_dict:
-                # Crear categoría sin configuraciones primero
-                categoria = Categoria(
-                    categoria_data['id'],
-                    categoria_data['nombre'],
-                    categoria_data['descripcion'],
-                    categoria_data['cargaTrabajo']
-                )
-                categorias.append(categoria)
-
-                # Convertir configuraciones de esta categoría
-                for config_data in categoria_data.get('configuraciones', []):
-                    configuracion = Configuracion(
-                        config_data['id'],
-                        config_data['nombre'],
-                        config_data['descripcion'],
-                        categoria_data['id']  # id de la categoría padre
-                    )
+            db = self._cargar_snapshot() if self.usar_snapshot else None
+            desde_xml = db is None
+            if desde_xml:
+                db = self._cargar_xml()
+            db = Repositorio(db)
 
-                    # Agregar recursos a la configuración
-                    for recurso_config_data in config_data.get('recursos', []):
-                        recurso_config = RecursoConfiguracion(
-                            recurso_config_data['idRecurso'],
-                            recurso_config_data['cantidad']
-                        )
-                        configuracion.agregar_recurso(recurso_config)
-
-                    configuraciones.append(configuracion)
-                    categoria.agregar_configuracion(configuracion)
-
-            # Convertir clientes
-            clientes = []
-            instancias = []
-            for cliente_data in clientes_dict:
-                cliente = Cliente(
-                    cliente_data['nit'],
-                    cliente_data['nombre'],
-                    cliente_data['usuario'],
-                    cliente_data['clave'],
-                    cliente_data['direccion'],
-                    cliente_data['correoElectronico']
-                )
-                clientes.append(cliente)
-
-                # Convertir instancias de este cliente
-                for instancia_data in cliente_data.get('instancias', []):
-                    instancia = Instancia(
-                        instancia_data['id'],
-                        instancia_data['idConfiguracion'],
-                        instancia_data['nombre'],
-                        instancia_data['fechaInicio'],
-                        cliente_data['nit']
-                    )
-                    instancia.estado = instancia_data.get('estado', 'Vigente')
-                    instancia.fecha_final = instancia_data.get('fechaFinal')
-
-                    instancias.append(instancia)
-                    cliente.agregar_instancia(instancia)
-
-            # Convertir facturas
-            facturas = []
-            for factura_data in facturas_dict:
-                factura = Factura(
-                    factura_data['id'],
-                    factura_data['nitCliente'],
-                    factura_data['fechaEmision'],
-                    factura_data['periodo']
-                )
-                factura.monto_total = factura_data.get('montoTotal', 0.0)
+            # Se cargan los meses activos; los históricos quedan para cuando se pidan
+            db['facturas'].activar(self._cargar_segmento_facturas)
+            if desde_xml and self.usar_snapshot and not self.solo_lectura:
+                self.guardar_snapshot(db)
 
-                for detalle_data in factura_data.get('detalles', []):
-                    detalle = DetalleFactura(
-                        detalle_data['idInstancia'],
-                        detalle_data['tiempoTotal'],
-                        detalle_data['monto']
-                    )
-                    factura.agregar_detalle(detalle)
+            if self.bitacora:
+                self._reproducir_bitacora(db)
 
-                facturas.append(factura)
+            # Después de la bitácora: las instancias que recrea también leen su almacén
+            for instancia in db['instancias']:
+                instancia.cargador_consumos = partial(self.almacen_consumos.leer, instancia.id)
+                instancia.cargador_diarios = partial(self.almacen_consumos.leer_diarios, instancia.id)
 
-            return {
-                'recursos': recursos,
-                'categorias': categorias,
-                'clientes': clientes,
-                'configuraciones': configuraciones,
-                'instancias': instancias,
-                'consumos': [],  # Por ahora vacío
-                'facturas': facturas
-            }
+            return db
 
         except Exception as e:
             print(f" Error cargando datos: {e}")
 
-            return {
+            return Repositorio({
                 'recursos': [],
                 'categorias': [],
                 'clientes': [],
                 'configuraciones': [],
                 'instancias': [],
                 'consumos': [],
-                'facturas': []
-            }
-
-    def _extraer_configuraciones(self):
-        """Extraer todas las configuraciones de las categorías"""
-        configuraciones = []
-        categorias = self.cargar_categorias()
-
-        for categoria in categorias:
-            configuraciones.extend(categoria['configuraciones'])
-
-        return configuraciones
-
-    def _extraer_instancias(self):
-        """Extraer todas las instancias de los clientes"""
-        instancias = []
-        clientes = self.cargar_clientes()
-
-        for cliente in clientes:
-            instancias.extend(cliente['instancias'])
+                'facturas': ArchivoFacturas(meses_activos=self.meses_facturas_activos,
+                                            max_historicos=self.max_segmentos_historicos)
+            })
+        finally:
+            gc.enable()
+
+    def _cargar_xml(self):
+        """Construir el db desde los XML en una sola pasada"""
+        if self.carga_paralela and (os.cpu_count() or 1) > 1:
+            # Los archivos son independientes: cada uno se parsea en su propio proceso
+            # y el enlace se hace cuando llegan todas las partes. Con un solo núcleo
+            # el costo de devolver los objetos al proceso padre no se compensa
+            # Cada partición de clientes es un trabajo aparte
+            with ProcessPoolExecutor() as pool:
+                futuros = [pool.submit(_cargar_coleccion, self.base_path, c)
+                           for c in ("recursos", "categorias")]
+                futuros_clientes = [pool.submit(_cargar_coleccion, self.base_path, "clientes", archivo)
+                                    for archivo in self._archivos_clientes()]
+                recursos, categorias = [futuro.result() for futuro in futuros]
+                clientes = [cliente for futuro in futuros_clientes for cliente in futuro.result()]
+        else:
+            recursos = list(self.iterar_recursos())
+            categorias = list(self.iterar_categorias())
+            clientes = list(self.iterar_clientes())
+        facturas = self._cargar_archivo_facturas()
+
+        if not self.solo_lectura and self._particiones_manifiesto() != (self.particiones_clientes or None):
+            # Pasar los clientes al formato configurado: del clientes.xml único a
+            # particiones, a otra cantidad de particiones o de vuelta al archivo único
+            self.guardar_clientes(clientes)
+            if not self.particiones_clientes:
+                self._eliminar_particiones_sobrantes()
+                os.remove(os.path.join(self.base_path, MANIFIESTO_CLIENTES))
+
+        return {
+            'recursos': recursos,
+            'categorias': categorias,
+            'clientes': clientes,
+            'configuraciones': [config for categoria in categorias for config in categoria.configuraciones],
+            'instancias': [instancia for cliente in clientes for instancia in cliente.instancias],
+            'consumos': [],  # Los consumos viven en el almacén binario
+            'facturas': facturas
+        }
+
+    # ==================== SNAPSHOT BINARIO ====================
+
+    def _firma_archivos(self):
+        """mtime y checksum de cada XML del checkpoint"""
+        firma = {}
+        for filename in self._archivos_checkpoint():
+            ruta = os.path.join(self.base_path, filename)
+            if not os.path.exists(ruta):
+                firma[filename] = None
+                continue
+            checksum = 0
+            with open(ruta, 'rb') as f:
+                for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                    checksum = zlib.crc32(bloque, checksum)
+            firma[filename] = (os.stat(ruta).st_mtime_ns, checksum)
+        return firma
+
+    def guardar_snapshot(self, db):
+        """Escribir el db ya hidratado en un pickle junto con la firma de los XML"""
+        ruta = os.path.join(self.base_path, "snapshot.bin")
+        fd, ruta_temporal = tempfile.mkstemp(dir=self.base_path, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'version': VERSION_SNAPSHOT, 'firma': self._firma_archivos(), 'db': db},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            ajustar_permisos(ruta_temporal, ruta)
+            os.replace(ruta_temporal, ruta)
+            self._snapshot_vigente = True
+        finally:
+            if os.path.exists(ruta_temporal):
+                os.remove(ruta_temporal)
+
+    def _cargar_snapshot(self):
+        """Devolver el db del snapshot o None si no existe o ya no coincide con los XML"""
+        ruta = os.path.join(self.base_path, "snapshot.bin")
+        if not os.path.exists(ruta):
+            return None
+
+        mtime_snapshot = os.stat(ruta).st_mtime_ns
+        for filename in self._archivos_checkpoint():
+            ruta_xml = os.path.join(self.base_path, filename)
+            if os.path.exists(ruta_xml) and os.stat(ruta_xml).st_mtime_ns > mtime_snapshot:
+                return None
 
-        return instancias
\ No newline at end of file
+        try:
+            with open(ruta, 'rb') as f:
+                snapshot = pickle.load(f)
+        except Exception as e:
+            print(f" Snapshot ilegible, se carga desde XML: {e}")
+            return None
+
+        if snapshot.get('version') != VERSION_SNAPSHOT or snapshot.get('firma') != self._firma_archivos():
+            return None
+        self._snapshot_vigente = True
+        return snapshot['db']
+
+    # ==================== CARGA EN STREAMING ====================
+
+    def _iterar_elementos(self, filename, tag):
+        """
+        Recorrer los hijos directos `tag` de la raíz con iterparse.
+        Cada elemento se libera después de entregarlo, así la memoria no crece con el archivo.
+        """
+        ruta = os.path.join(self.base_path, filename)
+        if not os.path.exists(ruta):
+            return
+
+        contexto = ET.iterparse(ruta, events=('start', 'end'))
+        _, raiz = next(contexto)
+        profundidad = 1
+        for evento, elem in contexto:
+            if evento == 'start':
+                profundidad += 1
+                continue
+            profundidad -= 1
+            if profundidad == 1 and elem.tag == tag:
+                yield elem
+                raiz.clear()
+
+    def iterar_recursos(self):
+        """Recursos de recursos.xml como objetos Recurso"""
+        for recurso_elem in self._iterar_elementos("recursos.xml", "recurso"):
+            yield Recurso(
+                int(recurso_elem.get('id')),
+                recurso_elem.findtext('nombre'),
+                recurso_elem.findtext('abreviatura'),
+                recurso_elem.findtext('metrica'),
+                recurso_elem.findtext('tipo'),
+                float(recurso_elem.findtext('valorXhora'))
+            )
+
+    def iterar_categorias(self):
+        """Categorías de categorias.xml con sus configuraciones ya enlazadas"""
+        for categoria_elem in self._iterar_elementos("categorias.xml", "categoria"):
+            categoria = Categoria(
+                int(categoria_elem.get('id')),
+                categoria_elem.findtext('nombre'),
+                categoria_elem.findtext('descripcion'),
+                categoria_elem.findtext('cargaTrabajo')
+            )
+
+            for config_elem in categoria_elem.iterfind('listaConfiguraciones/configuracion'):
+                configuracion = Configuracion(
+                    int(config_elem.get('id')),
+                    config_elem.findtext('nombre'),
+                    config_elem.findtext('descripcion'),
+                    categoria.id
+                )
+                for recurso_elem in config_elem.iterfind('recursosConfiguracion/recurso'):
+                    configuracion.agregar_recurso(
+                        RecursoConfiguracion(int(recurso_elem.get('id')), float(recurso_elem.text))
+                    )
+                categoria.agregar_configuracion(configuracion)
+
+            yield categoria
+
+    def iterar_clientes(self, archivo=None):
+        """Clientes (de un archivo o de todas las particiones) con sus instancias ya enlazadas"""
+        archivos = [archivo] if archivo else self._archivos_clientes()
+        for cliente_elem in (elem for a in archivos for elem in self._iterar_elementos(a, "cliente")):
+            cliente = Cliente(
+                cliente_elem.get('nit'),
+                cliente_elem.findtext('nombre'),
+                cliente_elem.findtext('usuario'),
+                cliente_elem.findtext('clave'),
+                cliente_elem.findtext('direccion'),
+                cliente_elem.findtext('correoElectronico')
+            )
+
+            for instancia_elem in cliente_elem.iterfind('listaInstancias/instancia'):
+                instancia = Instancia(
+                    int(instancia_elem.get('id')),
+                    int(instancia_elem.findtext('idConfiguracion')),
+                    instancia_elem.findtext('nombre'),
+                    instancia_elem.findtext('fechaInicio'),
+                    cliente.nit
+                )
+                instancia.estado = instancia_elem.findtext('estado', 'Vigente')
+                instancia.fecha_final = instancia_elem.findtext('fechaFinal')
+                cliente.agregar_instancia(instancia)
+
+            yield cliente
+
+    def iterar_facturas(self, archivo=None):
+        """Facturas (de un archivo o de todos los meses) con sus detalles"""
+        archivos = [archivo] if archivo else self._archivos_facturas()
+        for factura_elem in (elem for a in archivos for elem in self._iterar_elementos(a, "factura")):
+            factura = Factura(
+                int(factura_elem.get('id')),
+                factura_elem.findtext('nitCliente'),
+                factura_elem.findtext('fechaEmision'),
+                factura_elem.findtext('periodo')
+            )
+
+            for detalle_elem in factura_elem.iterfind('detalles/detalle'):
+                factura.agregar_detalle(DetalleFactura(
+                    int(detalle_elem.findtext('idInstancia')),
+                    float(detalle_elem.findtext('tiempoTotal')),
+                    float(detalle_elem.findtext('monto'))
+                ))
+            # agregar_detalle ya acumula el total; el guardado manda si difiere
+            factura.monto_total = float(factura_elem.findtext('montoTotal', factura.monto_total))
+
+            yield factura
+
+    # ==================== CONSUMOS ====================
+
+    def agregar_consumos(self, registrados):
+        """Persistir consumos nuevos, recibidos como pares (instancia, consumo)"""
+        por_instancia = {}
+        for instancia, consumo in registrados:
+            por_instancia.setdefault(instancia.id, []).append(consumo)
+        for id_instancia, consumos in por_instancia.items():
+            self.almacen_consumos.agregar(id_instancia, consumos)
+
+    def eliminar_consumos(self):
+        """Borrar todos los consumos guardados"""
+        self.almacen_consumos.eliminar_todo()
+
+    # ==================== BITÁCORA ====================
+
+    def registrar(self, op, datos):
+        """Registrar una mutación del db: la marca como cambio y, en modo bitácora, la agrega al log"""
+        self._marcar_operacion(op, datos)
+        if self.bitacora:
+            self.bitacora.agregar(op, datos)
+
+    def _marcar_operacion(self, op, datos):
+        """Traducir una operación a la colección (archivo) y registro que modifica"""
+        if op in ('recurso', 'precio'):
+            self.marcar_cambio('recursos', datos['id'])
+        elif op == 'categoria':
+            self.marcar_cambio('categorias', datos['id'])
+        elif op == 'configuracion':
+            # Las configuraciones se guardan anidadas en su categoría
+            self.marcar_cambio('categorias', datos['idCategoria'])
+        elif op == 'cliente':
+            self.marcar_cambio('clientes', datos['nit'])
+        elif op in ('instancia', 'cancelacion'):
+            self.marcar_cambio('clientes', datos['nitCliente'])
+        elif op == 'factura':
+            self.marcar_cambio('facturas', datos['id'])
+        elif op == 'reset':
+            for coleccion in ('recursos', 'categorias', 'clientes', 'facturas'):
+                self.marcar_cambio(coleccion)
+
+    def _reproducir_bitacora(self, db):
+        """Aplicar los registros de la bitácora sobre el último checkpoint"""
+        aplicados = 0
+        for registro in self.bitacora.leer():
+            op = registro['op']
+            datos = registro['datos']
+
+            # Las altas se ignoran si ya existen: el checkpoint pudo escribirse
+            # antes de que la bitácora se truncara
+            if op == 'recurso':
+                if not db['recursos'].existe(datos['id']):
+                    db['recursos'].append(Recurso.from_dict(datos))
+            elif op == 'precio':
+                db.actualizar_valor_recurso(datos['id'], datos['valorXhora'])
+            elif op == 'categoria':
+                if not db['categorias'].existe(datos['id']):
+                    db['categorias'].append(Categoria.from_dict(datos))
+            elif op == 'configuracion':
+                if not db['configuraciones'].existe(datos['id']):
+                    configuracion = Configuracion.from_dict(datos)
+                    db['configuraciones'].append(configuracion)
+                    categoria = db['categorias'].buscar(configuracion.id_categoria)
+                    if categoria:
+                        categoria.agregar_configuracion(configuracion)
+            elif op == 'cliente':
+                if not db['clientes'].existe(datos['nit']):
+                    db['clientes'].append(Cliente.from_dict(datos))
+            elif op == 'instancia':
+                if not db['instancias'].existe(datos['id']):
+                    # Los consumos se leen del almacén binario, no de la bitácora
+                    instancia = Instancia.from_dict(dict(datos, consumos=[]))
+                    db['instancias'].append(instancia)
+                    cliente = db['clientes'].buscar(instancia.nit_cliente)
+                    if cliente:
+                        cliente.agregar_instancia(instancia)
+            elif op == 'cancelacion':
+                instancia = db['instancias'].buscar(datos['idInstancia'])
+                if instancia:
+                    instancia.cancelar(datos['fechaFinal'])
+            elif op == 'factura':
+                if db['facturas'].buscar(datos['id']) is None:
+                    db['facturas'].append(Factura.from_dict(datos))
+            elif op == 'reset':
+                # El almacén de consumos ya se vació al momento del reset
+                for key in db:
+                    db[key].clear()
+            else:
+                print(f" Operación de bitácora desconocida: {op}")
+                continue
+            # Lo reproducido todavía no está en los XML
+            self._marcar_operacion(op, datos)
+            aplicados += 1
+
+        if aplicados:
+            print(f" Bitácora: {aplicados} operaciones reproducidas")
+
+    def compactar(self, db):
+        """Consolidar la bitácora en los archivos XML y vaciarla"""
+        with self.lock:
+            self.guardar_cambios(db)
+            if self.usar_snapshot and not self._snapshot_vigente:
+                self.guardar_snapshot(db)
+            if self.bitacora:
+                self.bitacora.truncar()
+
+    def iniciar_compactacion(self, db, intervalo=30, umbral=1):
+        """Compactar en segundo plano cada `intervalo` segundos si hay al menos `umbral` registros"""
+        if not self.bitacora or self._hilo_compactacion:
+            return
+
+        def _ciclo():
+            while True:
+                time.sleep(intervalo)
+                if self.bitacora.pendientes >= umbral:
+                    try:
+                        self.compactar(db)
+                    except Exception as e:
+                        print(f" Error compactando la bitácora: {e}")
+
+        self._hilo_compactacion = threading.Thread(target=_ciclo, name="compactacion-bitacora", daemon=True)
+        self._hilo_compactacion.start()
@@ -0,0 +1,43 @@
+"""
+Importar el directorio de datos XML (recursos, categorías, clientes, consumos y
+facturas) a la base SQLite que usa ALMACENAMIENTO=sqlite.
+
+El directorio XML se abre en solo lectura con la misma configuración que usa
+app.py (PARTICIONES_CLIENTES, MODO_BITACORA): se leen las particiones de
+clientes y se reproduce la bitácora, sin reescribir nada en el origen. La
+copia a SQLite va en una sola transacción: si falla, la base queda como estaba.
+
+Uso:
+    python migrar_a_sqlite.py [directorio_xml] [ruta_sqlite]
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.xml_manager import XMLManager
+from database.sqlite_manager import SQLiteManager
+
+
+def migrar(directorio_xml="data", ruta_sqlite="data/nube.db",
+           particiones_clientes=None, modo_bitacora=None):
+    """Copiar todo el contenido de los XML a SQLite (reemplaza lo que hubiera)"""
+    if particiones_clientes is None:
+        particiones_clientes = int(os.environ.get('PARTICIONES_CLIENTES', '0'))
+    if modo_bitacora is None:
+        modo_bitacora = os.environ.get('MODO_BITACORA', '0') == '1'
+    origen = XMLManager(directorio_xml, modo_bitacora=modo_bitacora, usar_snapshot=False,
+                        particiones_clientes=particiones_clientes, solo_lectura=True)
+    db = origen.cargar_todo()
+
+    registrados = [(instancia, consumo) for instancia in db['instancias'] for consumo in instancia.consumos]
+    SQLiteManager(ruta_sqlite).importar(db, registrados)
+
+    print(f" Migración completa a {ruta_sqlite}:")
+    print(f"   {len(db['recursos'])} recursos, {len(db['categorias'])} categorías, "
+          f"{len(db['configuraciones'])} configuraciones")
+    print(f"   {len(db['clientes'])} clientes, {len(db['instancias'])} instancias, "
+          f"{len(registrados)} consumos, {len(db['facturas'])} facturas")
+
+
+if __name__ == '__main__':
+    migrar(*sys.argv[1:3])
@@ -21,20 +21,55 @@ class Configuracion:
         self.descripcion = descripcion
         self.id_categoria = id_categoria
         self.recursos = []  # Lista de RecursoConfiguracion
+        self._desglose = None  # Costos memoizados por línea
+        self._versiones = []  # (Recurso, versión) con que se calcularon
 
     def agregar_recurso(self, recurso_config):
+        # Solo antes de insertarla en db['configuraciones']: ahí se indexa por recurso
         self.recursos.append(recurso_config)
+        self._desglose = None
+
+    def desglose_costo_hora(self, recursos_lista):
+        """
+        Costo por hora de cada línea como (Recurso, cantidad, costo por hora).
+        Se memoiza hasta que cambien las líneas o el precio de alguno de sus recursos.
+        """
+        if self._desglose is not None and all(r.version == v for r, v in self._versiones):
+            return self._desglose
+
+        buscar = getattr(recursos_lista, 'buscar', None)  # Índice del repositorio si lo hay
+        desglose = []
+        completo = True
+        for recurso_config in self.recursos:
+            if buscar:
+                recurso = buscar(recurso_config.id_recurso)
+            else:
+                recurso = next((r for r in recursos_lista if r.id == recurso_config.id_recurso), None)
+            if recurso:
+                desglose.append((recurso, recurso_config.cantidad, recurso.valor_x_hora * recurso_config.cantidad))
+            else:
+                completo = False
+
+        # Si falta un recurso no se memoiza: puede crearse después
+        if completo:
+            self._desglose = desglose
+            self._versiones = [(recurso, recurso.version) for recurso, _, _ in desglose]
+        return desglose
 
     def calcular_costo_hora(self, recursos_lista):
         """Calcular el costo por hora de esta configuración"""
         costo_total = 0.0
-        for recurso_config in self.recursos:
-            #  BUSCAR EN LA LISTA DIRECTAMENTE
-            recurso = next((r for r in recursos_lista if r.id == recurso_config.id_recurso), None)
-            if recurso:
-                costo_total += recurso.valor_x_hora * recurso_config.cantidad
+        for _, _, costo in self.desglose_costo_hora(recursos_lista):
+            costo_total += costo
         return costo_total
 
+    def __getstate__(self):
+        # El cálculo memoizado no va al snapshot
+        estado = self.__dict__.copy()
+        estado['_desglose'] = None
+        estado['_versiones'] = []
+        return estado
+
     def to_dict(self):
         return {
             'id': self.id,
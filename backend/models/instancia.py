@@ -1,9 +1,78 @@
+import threading
+from bisect import bisect_left, bisect_right
 from datetime import datetime
+from utils.date_utils import fecha_hora_a_minutos, minutos_a_fecha_hora
+
+MINUTOS_DIA = 24 * 60
+
+# Los reportes leen sin el lock del almacenamiento: la carga diferida de una
+# instancia la hace un solo hilo, o los guardados se sumarían dos veces
+_CARGA = threading.Lock()
+
+
+class IndiceAcumulado:
+    """
+    Claves ordenadas (minutos o días desde 1970) con las horas acumuladas hasta
+    cada una: las horas de un rango salen de dos búsquedas binarias, O(log n).
+    """
+
+    def __init__(self, pares=()):
+        self.claves = []
+        self.acumulado = [0.0]
+        for clave, horas in sorted(pares):
+            self.agregar(clave, horas)
+
+    def agregar(self, clave, horas):
+        """Agregar al final (la clave no puede ser menor que la última)"""
+        self.claves.append(clave)
+        self.acumulado.append(self.acumulado[-1] + horas)
+
+    def ultima(self):
+        return self.claves[-1] if self.claves else None
+
+    def sumar(self, desde, hasta):
+        """Horas con clave entre desde y hasta (ambos inclusive)"""
+        inicio = bisect_left(self.claves, desde)
+        fin = bisect_right(self.claves, hasta)
+        if fin <= inicio:
+            return 0.0
+        return self.acumulado[fin] - self.acumulado[inicio]
+
+
+def acumular_diarios(consumos, diarios=None):
+    """Sumar horas por día (desde 1970) a partir de objetos Consumo"""
+    diarios = {} if diarios is None else diarios
+    for consumo in consumos:
+        if consumo.marca is None:
+            continue  # Fecha ilegible: no cae en ningún día
+        dia = consumo.marca // MINUTOS_DIA
+        diarios[dia] = diarios.get(dia, 0.0) + consumo.tiempo
+    return diarios
+
+def combinar_diarios(guardados, pendientes):
+    """Sumar a los acumulados leídos del almacén los que llegaron en memoria antes de leerlos"""
+    for dia, horas in pendientes.items():
+        guardados[dia] = guardados.get(dia, 0.0) + horas
+    return guardados
 
 class Consumo:
-    def __init__(self, tiempo, fecha_hora):
+    def __init__(self, tiempo, fecha_hora=None, marca=None):
         self.tiempo = float(tiempo)  # Horas de consumo
-        self.fecha_hora = fecha_hora  # String con fecha/hora
+        # Minutos desde 1970: se calcula una sola vez y los filtros comparan enteros
+        if marca is None and fecha_hora is not None:
+            try:
+                marca = fecha_hora_a_minutos(fecha_hora)
+            except (TypeError, ValueError):
+                marca = None  # Fecha ilegible: no cae en ningún período
+        self.marca = marca
+        self._fecha_hora = fecha_hora  # Texto original, solo para mostrar
+
+    @property
+    def fecha_hora(self):
+        """Fecha/hora como texto 'dd/mm/yyyy hh:mi' (se arma desde la marca si no vino texto)"""
+        if self._fecha_hora is None and self.marca is not None:
+            self._fecha_hora = minutos_a_fecha_hora(self.marca)
+        return self._fecha_hora
 
     def to_dict(self):
         return {
@@ -25,10 +94,106 @@ class Instancia:
         self.estado = "Vigente"  # "Vigente" o "Cancelada"
         self.fecha_final = None
         self.nit_cliente = nit_cliente
-        self.consumos = []  # Lista de objetos Consumo
+        self._consumos = []  # Lista de objetos Consumo
+        self.cargador_consumos = None  # Función que trae los consumos guardados (carga diferida)
+        # Índice por fecha de los consumos (se arma al consultar) y cuántos ya incluye
+        self._indice_consumos = None
+        self._indexados = 0
+        # Horas por día (días desde 1970); se guardan aparte de los consumos
+        self._diarios = {}
+        self.cargador_diarios = None  # Función que trae el acumulado diario guardado
+        self.version_diarios = 0  # Sube con cada consumo agregado
+        # Índice de los días, rearmado cuando cambia version_diarios: (versión, índice)
+        self._indice_diarios = None
+
+    @property
+    def consumos(self):
+        """Consumos de la instancia; los guardados se leen la primera vez que se piden"""
+        if self.cargador_consumos is not None:
+            with _CARGA:
+                if self.cargador_consumos is not None:
+                    self._consumos = self.cargador_consumos() + self._consumos
+                    self.cargador_consumos = None
+                    self._indice_consumos = None
+        return self._consumos
+
+    @property
+    def diarios(self):
+        """Acumulado diario de la instancia; el guardado se lee la primera vez que se pide"""
+        if self.cargador_diarios is not None:
+            with _CARGA:
+                if self.cargador_diarios is not None:
+                    self._diarios = combinar_diarios(self.cargador_diarios(), self._diarios)
+                    self.cargador_diarios = None
+                    self._indice_diarios = None
+        return self._diarios
+
+    def origen_diarios(self):
+        """
+        (cargador, acumulado en memoria) sin leer el almacén, para que otro
+        proceso arme los diarios por su cuenta con combinar_diarios
+        """
+        with _CARGA:
+            return self.cargador_diarios, self._diarios
+
+    def __getstate__(self):
+        # Los consumos se releen del almacén: no van en el snapshot
+        estado = self.__dict__.copy()
+        estado['_consumos'] = []
+        estado['cargador_consumos'] = None
+        estado['_diarios'] = {}
+        estado['cargador_diarios'] = None
+        estado['_indice_consumos'] = None
+        estado['_indexados'] = 0
+        estado['_indice_diarios'] = None
+        return estado
+
+    def _actualizar_indice_consumos(self):
+        """Agregar al índice los consumos que llegaron desde la última consulta"""
+        consumos = self.consumos
+        if self._indice_consumos is None or len(consumos) < self._indexados:
+            self._indice_consumos = IndiceAcumulado()
+            self._indexados = 0
+
+        indice = self._indice_consumos
+        for consumo in consumos[self._indexados:]:
+            if consumo.marca is None:
+                continue  # Fecha ilegible: no cae en ningún período
+            if indice.claves and consumo.marca < indice.ultima():
+                # Llegó fuera de orden: se reordena todo (caso raro)
+                self._indice_consumos = IndiceAcumulado(
+                    (c.marca, c.tiempo) for c in consumos if c.marca is not None)
+                break
+            indice.agregar(consumo.marca, consumo.tiempo)
+        self._indexados = len(consumos)
+        return self._indice_consumos
+
+    def horas_en_rango(self, desde, hasta):
+        """
+        Horas consumidas entre dos marcas (minutos desde 1970, ambas inclusive) en
+        O(log n). Si el rango son días completos se responde con los acumulados
+        diarios, sin leer los consumos.
+        """
+        if desde % MINUTOS_DIA == 0 and (hasta + 1) % MINUTOS_DIA == 0:
+            return self.horas_en_dias(desde // MINUTOS_DIA, hasta // MINUTOS_DIA)
+        return self._actualizar_indice_consumos().sumar(desde, hasta)
+
+    def indice_diarios(self):
+        """Índice de los acumulados diarios (se rearma solo si llegaron consumos desde el último)"""
+        diarios = self.diarios
+        if self._indice_diarios is None or self._indice_diarios[0] != self.version_diarios:
+            # Los días llegan casi en orden: ordenarlos cuesta poco más que recorrerlos
+            self._indice_diarios = (self.version_diarios, IndiceAcumulado(diarios.items()))
+        return self._indice_diarios[1]
+
+    def horas_en_dias(self, dia_desde, dia_hasta):
+        """Horas consumidas entre dos días (desde 1970, ambos inclusive) sin leer los consumos, en O(log n)"""
+        return self.indice_diarios().sumar(dia_desde, dia_hasta)
 
     def agregar_consumo(self, consumo):
         self.consumos.append(consumo)
+        acumular_diarios((consumo,), self.diarios)
+        self.version_diarios += 1
 
     def cancelar(self, fecha_final):
         self.estado = "Cancelada"
@@ -5,7 +5,17 @@ class Recurso:
         self.abreviatura = abreviatura
         self.metrica = metrica
         self.tipo = tipo  # "Hardware" o "Software"
-        self.valor_x_hora = float(valor_x_hora)
+        self.version = 0  # Sube con cada cambio de precio (invalida los costos memoizados)
+        self.valor_x_hora = valor_x_hora
+
+    @property
+    def valor_x_hora(self):
+        return self._valor_x_hora
+
+    @valor_x_hora.setter
+    def valor_x_hora(self, valor):
+        self._valor_x_hora = float(valor)
+        self.version += 1
 
     def to_dict(self):
         return {
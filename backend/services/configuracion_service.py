@@ -23,11 +23,14 @@ class ProcesadorConfiguracion:
             "configuraciones_creadas": 0,
             "clientes_creados": 0,
             "instancias_creadas": 0,
+            "recursos_actualizados": 0,
             "errores": []
         }
+        self.actualizados = []  # Recursos existentes cuyo precio cambió en el último mensaje
 
     def procesar_xml(self, xml_data, db):
         """Procesar el XML de configuración completa"""
+        self.actualizados = []
         try:
             print("=" * 60)
             print(" DEBUG PROCESAR_XML - INICIO DETALLADO")
@@ -136,10 +139,17 @@ class ProcesadorConfiguracion:
                 id_recurso = int(recurso_elem.get('id'))
                 print(f" DEBUG: Procesando recurso {id_recurso}")
 
-                # Verificar si el recurso ya existe
-                recurso_existe = any(r.id == id_recurso for r in db['recursos'])
-                if recurso_existe:
-                    print(f" DEBUG: Recurso {id_recurso} ya existe, saltando")
+                # Verificar si el recurso ya existe: solo se actualiza el precio si cambió
+                recurso_existente = db['recursos'].buscar(id_recurso)
+                if recurso_existente:
+                    valor_x_hora = float(recurso_elem.find('valorXhora').text)
+                    if valor_x_hora != recurso_existente.valor_x_hora:
+                        afectadas = db.actualizar_valor_recurso(id_recurso, valor_x_hora)
+                        self.actualizados.append(recurso_existente)
+                        self.resultados['recursos_actualizados'] += 1
+                        print(f" DEBUG: Recurso {id_recurso} actualizado, {len(afectadas)} configuraciones recalculadas")
+                    else:
+                        print(f" DEBUG: Recurso {id_recurso} ya existe, saltando")
                     continue
 
                 nombre = recurso_elem.find('nombre').text.strip()
@@ -178,7 +188,7 @@ class ProcesadorConfiguracion:
                 print(f" DEBUG: Procesando categoría {id_categoria}")
 
                 # Verificar si la categoría ya existe
-                categoria_existente = next((c for c in db['categorias'] if c.id == id_categoria), None)
+                categoria_existente = db['categorias'].buscar(id_categoria)
                 if categoria_existente:
                     categoria = categoria_existente
                     print(f" DEBUG: Categoría {id_categoria} ya existe")
@@ -215,7 +225,7 @@ class ProcesadorConfiguracion:
                 print(f" DEBUG: Procesando configuración {id_config}")
 
                 # Verificar si existe esta config.
-                config_existente = any(c.id == id_config for c in db['configuraciones'])
+                config_existente = db['configuraciones'].existe(id_config)
                 if config_existente:
                     print(f" DEBUG: Configuración {id_config} ya existe, saltando")
                     continue
@@ -235,7 +245,7 @@ class ProcesadorConfiguracion:
                         print(f" DEBUG: Agregando recurso {id_recurso} a configuración {id_config}")
 
                         # Verificar que el recurso exista
-                        recurso_existe = any(r.id == id_recurso for r in db['recursos'])
+                        recurso_existe = db['recursos'].existe(id_recurso)
                         if not recurso_existe:
                             error_msg = f"Recurso {id_recurso} no existe en configuración {id_config}"
                             print(f" DEBUG: {error_msg}")
@@ -279,7 +289,7 @@ class ProcesadorConfiguracion:
                     continue
 
                 # Verificar si el cliente ya existe
-                cliente_existente = next((c for c in db['clientes'] if c.nit == nit), None)
+                cliente_existente = db['clientes'].buscar(nit)
                 if cliente_existente:
                     cliente = cliente_existente
                     print(f" DEBUG: Cliente {nit} ya existe")
@@ -318,7 +328,7 @@ class ProcesadorConfiguracion:
                 print(f" DEBUG: Procesando instancia {id_instancia}")
 
                 # Verificar si la instancia ya existe
-                instancia_existente = any(i.id == id_instancia for i in db['instancias'])
+                instancia_existente = db['instancias'].existe(id_instancia)
                 if instancia_existente:
                     print(f" DEBUG: Instancia {id_instancia} ya existe, saltando")
                     continue
@@ -336,7 +346,7 @@ class ProcesadorConfiguracion:
                     continue
 
                 # Verificar que la configuración exista
-                config_existente = any(c.id == id_configuracion for c in db['configuraciones'])
+                config_existente = db['configuraciones'].existe(id_configuracion)
                 if not config_existente:
                     error_msg = f"Configuración {id_configuracion} no existe para instancia {id_instancia}"
                     print(f"DEBUG: {error_msg}")
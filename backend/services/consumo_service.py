@@ -17,9 +17,11 @@ class ProcesadorConsumo:
             'consumos_procesados': 0,
             'errores': []
         }
+        self.registrados = []  # (instancia, consumo) registrados en el último mensaje
 
     def procesar_xml(self, xml_data, db):
         """Procesar el XML de consumo de recursos"""
+        self.registrados = []
         try:
             print("=" * 60)
             print(" DEBUG CONSUMO_SERVICE - INICIO")
@@ -36,6 +38,9 @@ class ProcesadorConsumo:
                 print(f"\n Procesando consumo {i + 1}...")
                 self._procesar_consumo(consumo_elem, db)
 
+            if self.registrados:
+                db.nueva_version()  # Cambia lo que se facturaría
+
             print("=" * 60)
             print(f" DEBUG CONSUMO_SERVICE - FIN")
             print(f" Consumos procesados: {self.resultados['consumos_procesados']}")
@@ -131,9 +136,15 @@ class ProcesadorConsumo:
                 self.resultados['errores'].append(error_msg)
                 return
 
-            # Crear y registrar el consumo
+            # Crear y registrar el consumo: la marca entera se calcula aquí una sola vez
             consumo = Consumo(tiempo_consumo, fecha_hora)
+            if consumo.marca is None:
+                error_msg = f"Fecha/hora inválida: {fecha_hora_texto}"
+                print(f" {error_msg}")
+                self.resultados['errores'].append(error_msg)
+                return
             instancia.agregar_consumo(consumo)
+            self.registrados.append((instancia, consumo))
 
             self.resultados['consumos_procesados'] += 1
             print(f" Consumo registrado exitosamente para instancia {id_instancia}")
@@ -146,23 +157,15 @@ class ProcesadorConsumo:
             self.resultados['errores'].append(error_msg)
 
     def _buscar_instancia(self, id_instancia, nit_cliente, db):
-        """Buscar una instancia por ID y NIT de cliente"""
-        print(f" Buscando instancia {id_instancia} para cliente {nit_cliente}")
-        print(f" Total de instancias en DB: {len(db['instancias'])}")
-
-        for instancia in db['instancias']:
-            print(f" Comparando: Instancia {instancia.id} - Cliente {instancia.nit_cliente}")
-            if instancia.id == id_instancia and instancia.nit_cliente == nit_cliente:
-                print(f" Instancia encontrada: {instancia.nombre}")
-                return instancia
-        print(f" Instancia NO encontrada")
-        return None
+        """Buscar una instancia por ID y NIT de cliente (índice compuesto, O(1))"""
+        return db['instancias'].buscar_por('cliente', nit_cliente, id_instancia)
 
     def obtener_consumos_por_cliente(self, nit_cliente, db, fecha_inicio=None, fecha_fin=None):
         """Obtener todos los consumos de un cliente en un rango de fechas"""
         consumos_cliente = []
 
-        for instancia in db['instancias']:
+        cliente = db['clientes'].buscar(nit_cliente)
+        for instancia in (cliente.instancias if cliente else []):
             if instancia.nit_cliente == nit_cliente:
                 for consumo in instancia.consumos:
                     # Si se especifica rango de fechas, filtrar
@@ -1,12 +1,55 @@
 # services/facturacion_service.py - CORREGIDO
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from models.factura import Factura, DetalleFactura
-from utils.date_utils import parsear_fecha, es_rango_fecha_valido, obtener_fecha_actual
+from models.instancia import MINUTOS_DIA, IndiceAcumulado, combinar_diarios
+from services.motor_vectorizado import MotorVectorizado, NUMPY_DISPONIBLE
+from utils.date_utils import parsear_fecha, es_rango_fecha_valido, obtener_fecha_actual, fecha_hora_a_minutos
 from datetime import datetime
 
 
+def _detalles_particion(particion, dia_desde, dia_hasta):
+    """
+    Calcular los detalles de un bloque de clientes en un proceso del pool.
+    Recibe [(nit, [(id_instancia, costo_por_hora, cargador, diarios)])] y devuelve
+    [(nit, [(id_instancia, tiempo_total, monto)])] en el mismo orden. Si la
+    instancia aún no leyó su acumulado, el proceso lo lee con el cargador.
+    """
+    resultados = []
+    for nit_cliente, instancias in particion:
+        detalles = []
+        for id_instancia, costo_por_hora, cargador, diarios in instancias:
+            if cargador is not None:
+                diarios = combinar_diarios(cargador(), diarios)
+            # Mismo índice que Instancia.horas_en_dias: el resultado es idéntico al secuencial
+            tiempo_total = IndiceAcumulado(diarios.items()).sumar(dia_desde, dia_hasta)
+            monto_instancia = costo_por_hora * tiempo_total
+            if monto_instancia > 0:
+                detalles.append((id_instancia, tiempo_total, monto_instancia))
+        resultados.append((nit_cliente, detalles))
+    return resultados
+
+
 class FacturacionService:
-    def __init__(self):
-        pass
+    # Por debajo de estas instancias el costo de repartir el trabajo no se compensa
+    MIN_INSTANCIAS_PARALELO = 5000
+    # Vistas previas de facturación guardadas (LRU)
+    MAX_PREVISUALIZACIONES = 32
+
+    def __init__(self, procesos=0, motor='python'):
+        # 0 o 1 = facturación secuencial; N > 1 = pool de N procesos
+        self.procesos = procesos
+        # motor='numpy' calcula montos y reportes con MotorVectorizado (si NumPy está instalado)
+        self.motor_vectorizado = None
+        if motor == 'numpy':
+            if NUMPY_DISPONIBLE:
+                self.motor_vectorizado = MotorVectorizado()
+            else:
+                print(" NumPy no está instalado: se usa el motor de facturación en Python")
+        self._previsualizaciones = OrderedDict()
+        self._lock_previsualizaciones = threading.Lock()
 
     def generar_facturas(self, db, fecha_inicio, fecha_fin):
         """
@@ -15,78 +58,211 @@ class FacturacionService:
         if not es_rango_fecha_valido(fecha_inicio, fecha_fin):
             return {'error': 'Rango de fechas inválido'}
 
-        facturas_generadas = []
-        clientes_procesados = set()
-
-        factura_id = self._obtener_siguiente_id(db)
-
-        for instancia in db['instancias']:
-            if instancia.nit_cliente in clientes_procesados:
-                continue
-
-            # Generar factura para este cliente
-            factura = self._generar_factura_cliente(
-                db, instancia.nit_cliente, fecha_inicio, fecha_fin, factura_id
-            )
-
-            if factura:
-                facturas_generadas.append(factura)
-                db['facturas'].append(factura)
-                clientes_procesados.add(instancia.nit_cliente)
-                factura_id += 1
+        facturas_generadas = list(self.iterar_facturas(db, fecha_inicio, fecha_fin))
 
         return {
             'facturas_generadas': len(facturas_generadas),
             'detalle': [factura.to_dict() for factura in facturas_generadas]
         }
 
-    def _generar_factura_cliente(self, db, nit_cliente, fecha_inicio, fecha_fin, factura_id):
-        """Generar factura para un cliente específico"""
-        cliente = next((c for c in db['clientes'] if c.nit == nit_cliente), None)
-        if not cliente:
-            return None
+    def previsualizar_facturas(self, db, fecha_inicio, fecha_fin):
+        """
+        Facturas que se generarían en un rango, sin guardarlas. El resultado se
+        guarda por (fecha_inicio, fecha_fin, db.version): mientras no cambien
+        consumos, precios, instancias ni facturas se devuelve el mismo.
+        """
+        if not es_rango_fecha_valido(fecha_inicio, fecha_fin):
+            return {'error': 'Rango de fechas inválido'}
+
+        # La fecha de hoy también entra en la clave porque va en fechaEmision
+        clave = (fecha_inicio, fecha_fin, db.version, obtener_fecha_actual())
+        with self._lock_previsualizaciones:
+            resultado = self._previsualizaciones.get(clave)
+            if resultado is not None:
+                self._previsualizaciones.move_to_end(clave)
+                return dict(resultado, desde_cache=True)
+
+        facturas = list(self.iterar_facturas(db, fecha_inicio, fecha_fin, guardar=False))
+        resultado = {
+            'facturas_generadas': len(facturas),
+            'detalle': [factura.to_dict() for factura in facturas],
+            'version': clave[2]
+        }
 
+        with self._lock_previsualizaciones:
+            self._previsualizaciones[clave] = resultado
+            while len(self._previsualizaciones) > self.MAX_PREVISUALIZACIONES:
+                self._previsualizaciones.popitem(last=False)
+        return dict(resultado, desde_cache=False)
+
+    def iterar_facturas(self, db, fecha_inicio, fecha_fin, guardar=True):
+        """
+        Generar las facturas de un rango (ya validado) de a una: cada factura se
+        agrega a db['facturas'] y se entrega apenas está lista. Con el motor en
+        Python secuencial los detalles también se calculan cliente por cliente.
+        Con guardar=False no se toca el db (vista previa).
+        """
+        dia_desde, dia_hasta = self._dias_del_periodo(fecha_inicio, fecha_fin)
+
+        # Una sola pasada: cada cliente se factura una vez con sus instancias ya agrupadas
+        grupos = self._agrupar_por_cliente(db)
+        if self.motor_vectorizado:
+            detalles_por_cliente = self.motor_vectorizado.detalles_por_cliente(db, grupos, dia_desde, dia_hasta)
+        elif self._usar_pool(grupos):
+            detalles_por_cliente = self._detalles_en_paralelo(db, grupos, dia_desde, dia_hasta)
+        else:
+            detalles_por_cliente = ((nit_cliente, self._detalles_cliente(db, instancias, dia_desde, dia_hasta))
+                                    for nit_cliente, instancias in grupos)
+
+        # Los ids se asignan aquí, en orden de NIT: el resultado no depende del modo
+        factura_id = self._obtener_siguiente_id(db)
         fecha_emision = obtener_fecha_actual()
         periodo = f"{fecha_inicio} - {fecha_fin}"
 
-        factura = Factura(factura_id, nit_cliente, fecha_emision, periodo)
-        total_factura = 0.0
-
-        for instancia in cliente.instancias:
-            if instancia.estado != "Vigente":
+        for nit_cliente, detalles in detalles_por_cliente:
+            if not detalles:
                 continue
 
-            configuracion = next((c for c in db['configuraciones'] if c.id == instancia.id_configuracion), None)
+            factura = Factura(factura_id, nit_cliente, fecha_emision, periodo)
+            for id_instancia, tiempo_total, monto_instancia in detalles:
+                factura.agregar_detalle(DetalleFactura(id_instancia, tiempo_total, monto_instancia))
+
+            if guardar:
+                db['facturas'].append(factura)
+                db.nueva_version()  # Cambian los ids de la próxima facturación
+            factura_id += 1
+            yield factura
+
+    def _dias_del_periodo(self, fecha_inicio, fecha_fin):
+        """Período en días desde 1970: desde el día de inicio hasta el de fin, ambos completos"""
+        return (fecha_hora_a_minutos(fecha_inicio) // MINUTOS_DIA,
+                fecha_hora_a_minutos(fecha_fin) // MINUTOS_DIA)
+
+    def _agrupar_por_cliente(self, db):
+        """Instancias vigentes de los clientes existentes agrupadas por NIT, en orden de NIT"""
+        por_cliente = {}
+        for instancia in self._facturables(db, db['instancias']):
+            por_cliente.setdefault(instancia.nit_cliente, []).append(instancia)
+        return [(nit_cliente, por_cliente[nit_cliente]) for nit_cliente in sorted(por_cliente)]
+
+    def _facturables(self, db, instancias):
+        """Instancias que se facturan: vigentes y de un cliente que existe"""
+        return [instancia for instancia in instancias
+                if instancia.estado == "Vigente" and db['clientes'].existe(instancia.nit_cliente)]
+
+    def _cargos(self, db, instancias, dia_desde, dia_hasta):
+        """
+        (instancia, configuración, tiempo_total, monto) de cada instancia con
+        consumo en el período. Solo lee el db.
+        """
+        for instancia in instancias:
+            configuracion = db['configuraciones'].buscar(instancia.id_configuracion)
             if not configuracion:
                 continue
 
+            # Memoizado en la configuración: no se recalcula por instancia
             costo_por_hora = configuracion.calcular_costo_hora(db['recursos'])
 
-            #  FILTRAR CONSUMOS POR FECHA
-            consumos_periodo = []
-            for consumo in instancia.consumos:
-                try:
-                    fecha_consumo = consumo.fecha_hora.split(' ')[0]  # Extraer fecha
-                    if fecha_inicio <= fecha_consumo <= fecha_fin:
-                        consumos_periodo.append(consumo)
-                except:
-                    continue
-
-            tiempo_total = sum(consumo.tiempo for consumo in consumos_periodo)
+            # Horas del período con el índice por fecha: días completos, sin recorrer los consumos
+            tiempo_total = instancia.horas_en_rango(dia_desde * MINUTOS_DIA, (dia_hasta + 1) * MINUTOS_DIA - 1)
             monto_instancia = costo_por_hora * tiempo_total
 
             if monto_instancia > 0:
-                detalle = DetalleFactura(instancia.id, tiempo_total, monto_instancia)
-                factura.agregar_detalle(detalle)
-                total_factura += monto_instancia
+                yield instancia, configuracion, tiempo_total, monto_instancia
+
+    def _detalles_cliente(self, db, instancias, dia_desde, dia_hasta):
+        """(id_instancia, tiempo_total, monto) de las instancias de un cliente con consumo en el período"""
+        return [(instancia.id, tiempo_total, monto_instancia)
+                for instancia, _, tiempo_total, monto_instancia
+                in self._cargos(db, instancias, dia_desde, dia_hasta)]
 
-        return factura if len(factura.detalles) > 0 else None
+    def _cargos_por_configuracion(self, db, fecha_inicio, fecha_fin):
+        """
+        Monto, horas e instancias que se facturarían en el período, agrupados por
+        configuración. Es el mismo cálculo de generar_facturas pero sin crear
+        facturas: los reportes no modifican el db.
+        """
+        dia_desde, dia_hasta = self._dias_del_periodo(fecha_inicio, fecha_fin)
+        if self.motor_vectorizado:
+            return self.motor_vectorizado.cargos_por_configuracion(
+                db, self._agrupar_por_cliente(db), dia_desde, dia_hasta
+            )
+
+        # Las instancias de cada configuración salen del índice del db
+        por_configuracion = {}
+        for configuracion in db['configuraciones']:
+            instancias = self._facturables(db, db.instancias_de_configuracion(configuracion.id))
+            for instancia, _, tiempo_total, monto_instancia in self._cargos(db, instancias, dia_desde, dia_hasta):
+                acumulado = por_configuracion.setdefault(configuracion.id, [0.0, 0.0, set()])
+                acumulado[0] += monto_instancia
+                acumulado[1] += tiempo_total
+                acumulado[2].add(instancia.id)
+        return por_configuracion
+
+    def _cargos_por_categoria(self, db, fecha_inicio, fecha_fin):
+        """Monto, configuraciones e instancias que se facturarían en el período, por categoría"""
+        por_categoria = {}
+        if self.motor_vectorizado:
+            # El motor agrupa por configuración; la categoría se resuelve una vez por cada una
+            for id_configuracion, (monto, _, instancias) in \
+                    self._cargos_por_configuracion(db, fecha_inicio, fecha_fin).items():
+                categoria = db.categoria_de_configuracion(id_configuracion)
+                if categoria:
+                    acumulado = por_categoria.setdefault(categoria.id, [0.0, set(), set()])
+                    acumulado[0] += monto
+                    acumulado[1].add(id_configuracion)
+                    acumulado[2].update(instancias)
+            return por_categoria
+
+        dia_desde, dia_hasta = self._dias_del_periodo(fecha_inicio, fecha_fin)
+        for categoria in db['categorias']:
+            instancias = self._facturables(db, db.instancias_de_categoria(categoria.id))
+            for instancia, configuracion, _, monto_instancia in self._cargos(db, instancias, dia_desde, dia_hasta):
+                acumulado = por_categoria.setdefault(categoria.id, [0.0, set(), set()])
+                acumulado[0] += monto_instancia
+                acumulado[1].add(configuracion.id)
+                acumulado[2].add(instancia.id)
+        return por_categoria
+
+    # ==================== FACTURACIÓN PARALELA ====================
+
+    def _usar_pool(self, grupos):
+        if self.procesos <= 1 or (os.cpu_count() or 1) <= 1:
+            return False
+        return sum(len(instancias) for _, instancias in grupos) >= self.MIN_INSTANCIAS_PARALELO
+
+    def _detalles_en_paralelo(self, db, grupos, dia_desde, dia_hasta):
+        """
+        Repartir los clientes (ya en orden de NIT) en bloques contiguos, calcular
+        los detalles en el pool y juntarlos en el mismo orden.
+        """
+        # Lo que viaja a cada proceso: el costo por hora ya resuelto y el cargador del
+        # acumulado diario (cada proceso lee el de sus instancias); solo va el acumulado
+        # en sí si ya estaba en memoria
+        paquetes = []
+        for nit_cliente, instancias in grupos:
+            paquete = []
+            for instancia in instancias:
+                configuracion = db['configuraciones'].buscar(instancia.id_configuracion)
+                if configuracion:
+                    cargador, diarios = instancia.origen_diarios()
+                    paquete.append((instancia.id, configuracion.calcular_costo_hora(db['recursos']),
+                                    cargador, diarios))
+            paquetes.append((nit_cliente, paquete))
+
+        # Varios bloques por proceso para repartir mejor clientes de tamaño desigual
+        num_bloques = self.procesos * 4
+        tamano = max(1, -(-len(paquetes) // num_bloques))
+        bloques = [paquetes[i:i + tamano] for i in range(0, len(paquetes), tamano)]
+
+        with ProcessPoolExecutor(max_workers=self.procesos) as pool:
+            resultados = pool.map(_detalles_particion, bloques,
+                                  [dia_desde] * len(bloques), [dia_hasta] * len(bloques))
+            return [detalle for resultado in resultados for detalle in resultado]
 
     def _obtener_siguiente_id(self, db):
         """Obtener siguiente ID basado en facturas existentes"""
-        if db['facturas']:
-            return max(f.id for f in db['facturas']) + 1
-        return 1
+        return db['facturas'].siguiente_id()
 
     def generar_reporte_analitico(self, db, fecha_inicio, fecha_fin, tipo_reporte):
         """Generar reporte analítico de ventas con datos REALES"""
@@ -100,55 +276,27 @@ class FacturacionService:
             return {'error': 'Tipo de reporte no válido. Use: categorias o recursos'}
 
     def _analizar_ingresos_por_categoria(self, db, fecha_inicio, fecha_fin):
-        """Analizar ingresos por categoría en un rango de fechas con datos REALES - CORREGIDO"""
+        """Analizar ingresos por categoría en un rango de fechas (solo lectura)"""
         ingresos_por_categoria = {}
         print(f" DEBUG - Analizando categorías para período: {fecha_inicio} a {fecha_fin}")
 
-        # Primero, generar facturas para el período solicitado
-        resultado_facturacion = self.generar_facturas(db, fecha_inicio, fecha_fin)
-
-        if 'error' in resultado_facturacion:
-            return {'error': resultado_facturacion['error']}
+        if not es_rango_fecha_valido(fecha_inicio, fecha_fin):
+            return {'error': 'Rango de fechas inválido'}
 
-        facturas_periodo = resultado_facturacion['detalle']
-        print(f" DEBUG - Facturas en período: {len(facturas_periodo)}")
+        # Montos del período por categoría con los índices del db, sin generar facturas
+        por_categoria = self._cargos_por_categoria(db, fecha_inicio, fecha_fin)
+        print(f" DEBUG - Categorías con consumo en período: {len(por_categoria)}")
 
-        if not facturas_periodo:
+        if not por_categoria:
             return {'mensaje': 'No hay facturas en el período seleccionado'}
 
-        # Procesar las facturas generadas en el período
-        for factura_data in facturas_periodo:
-            for detalle_data in factura_data.get('detalles', []):
-                instancia_id = detalle_data.get('idInstancia')
-                monto = detalle_data.get('monto', 0)
-
-                # Buscar la instancia
-                instancia = next((i for i in db['instancias'] if i.id == instancia_id), None)
-                if not instancia:
-                    continue
-
-                # Buscar configuración
-                configuracion = next((c for c in db['configuraciones'] if c.id == instancia.id_configuracion), None)
-                if not configuracion:
-                    continue
-
-                # Buscar categoría
-                categoria = next((cat for cat in db['categorias'] if cat.id == configuracion.id_categoria), None)
-                if not categoria:
-                    continue
-
-                # Acumular datos por categoría
-                if categoria.id not in ingresos_por_categoria:
-                    ingresos_por_categoria[categoria.id] = {
-                        'nombre': categoria.nombre,
-                        'configuraciones': set(),
-                        'instancias': set(),
-                        'ingresos': 0.0
-                    }
-
-                ingresos_por_categoria[categoria.id]['configuraciones'].add(configuracion.id)
-                ingresos_por_categoria[categoria.id]['instancias'].add(instancia.id)
-                ingresos_por_categoria[categoria.id]['ingresos'] += monto
+        for id_categoria, (monto_total, configuraciones, instancias) in por_categoria.items():
+            ingresos_por_categoria[id_categoria] = {
+                'nombre': db['categorias'].buscar(id_categoria).nombre,
+                'configuraciones': configuraciones,
+                'instancias': instancias,
+                'ingresos': monto_total
+            }
 
         # Convertir sets a contadores
         for categoria_id, datos in ingresos_por_categoria.items():
@@ -159,62 +307,46 @@ class FacturacionService:
         return ingresos_por_categoria
 
     def _analizar_ingresos_por_recurso(self, db, fecha_inicio, fecha_fin):
-        """Analizar ingresos por recurso en un rango de fechas con datos REALES - CORREGIDO"""
+        """Analizar ingresos por recurso en un rango de fechas (solo lectura)"""
         ingresos_por_recurso = {}
         print(f" DEBUG - Analizando recursos para período: {fecha_inicio} a {fecha_fin}")
 
-        # Primero, generar facturas para el período solicitado
-        resultado_facturacion = self.generar_facturas(db, fecha_inicio, fecha_fin)
-
-        if 'error' in resultado_facturacion:
-            return {'error': resultado_facturacion['error']}
+        if not es_rango_fecha_valido(fecha_inicio, fecha_fin):
+            return {'error': 'Rango de fechas inválido'}
 
-        facturas_periodo = resultado_facturacion['detalle']
-        print(f" DEBUG - Facturas en período: {len(facturas_periodo)}")
+        # Montos y horas del período agrupados por configuración: el reparto entre
+        # recursos es proporcional, así que basta con hacerlo una vez por configuración
+        por_configuracion = self._cargos_por_configuracion(db, fecha_inicio, fecha_fin)
+        print(f" DEBUG - Configuraciones con consumo en período: {len(por_configuracion)}")
 
-        if not facturas_periodo:
+        if not por_configuracion:
             return {'mensaje': 'No hay facturas en el período seleccionado'}
 
-        # Procesar las facturas generadas en el período
-        for factura_data in facturas_periodo:
-            for detalle_data in factura_data.get('detalles', []):
-                instancia_id = detalle_data.get('idInstancia')
-                monto_total = detalle_data.get('monto', 0)
-                tiempo_total = detalle_data.get('tiempoTotal', 0)
-
-                # Buscar la instancia
-                instancia = next((i for i in db['instancias'] if i.id == instancia_id), None)
-                if not instancia:
-                    continue
-
-                # Buscar configuración
-                configuracion = next((c for c in db['configuraciones'] if c.id == instancia.id_configuracion), None)
-                if not configuracion:
-                    continue
-
-                # Calcular costo por hora de la configuración
-                costo_por_hora = configuracion.calcular_costo_hora(db['recursos'])
-
-                if costo_por_hora > 0 and tiempo_total > 0:
-                    # Distribuir el monto entre los recursos
-                    for recurso_config in configuracion.recursos:
-                        recurso = next((r for r in db['recursos'] if r.id == recurso_config.id_recurso), None)
-                        if recurso:
-                            # Calcular proporción del costo que corresponde a este recurso
-                            costo_recurso_por_hora = recurso.valor_x_hora * recurso_config.cantidad
-                            proporcion = costo_recurso_por_hora / costo_por_hora
-                            monto_recurso = monto_total * proporcion
-                            uso_recurso = recurso_config.cantidad * tiempo_total
-
-                            if recurso.id not in ingresos_por_recurso:
-                                ingresos_por_recurso[recurso.id] = {
-                                    'nombre': recurso.nombre,
-                                    'tipo': recurso.tipo,
-                                    'uso_total': 0.0,
-                                    'ingresos': 0.0
-                                }
-
-                            ingresos_por_recurso[recurso.id]['uso_total'] += uso_recurso
-                            ingresos_por_recurso[recurso.id]['ingresos'] += monto_recurso
+        for id_configuracion, (monto_total, tiempo_total, _) in por_configuracion.items():
+            configuracion = db['configuraciones'].buscar(id_configuracion)
+            if not configuracion:
+                continue
+
+            # Calcular costo por hora de la configuración
+            costo_por_hora = configuracion.calcular_costo_hora(db['recursos'])
+
+            if costo_por_hora > 0 and tiempo_total > 0:
+                # Distribuir el monto entre los recursos (desglose memoizado)
+                for recurso, cantidad, costo_recurso_por_hora in configuracion.desglose_costo_hora(db['recursos']):
+                    # Calcular proporción del costo que corresponde a este recurso
+                    proporcion = costo_recurso_por_hora / costo_por_hora
+                    monto_recurso = monto_total * proporcion
+                    uso_recurso = cantidad * tiempo_total
+
+                    if recurso.id not in ingresos_por_recurso:
+                        ingresos_por_recurso[recurso.id] = {
+                            'nombre': recurso.nombre,
+                            'tipo': recurso.tipo,
+                            'uso_total': 0.0,
+                            'ingresos': 0.0
+                        }
+
+                    ingresos_por_recurso[recurso.id]['uso_total'] += uso_recurso
+                    ingresos_por_recurso[recurso.id]['ingresos'] += monto_recurso
         print(f" DEBUG - Recursos encontrados: {len(ingresos_por_recurso)}")
         return ingresos_por_recurso
\ No newline at end of file
@@ -0,0 +1,107 @@
+# services/motor_vectorizado.py - Facturación y reportes con NumPy (opcional)
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:  # Sin NumPy se usa el motor en Python de FacturacionService
+    np = None
+
+NUMPY_DISPONIBLE = np is not None
+
+
+class MotorVectorizado:
+    """
+    Motor de facturación en columnas: los acumulados diarios de todas las
+    instancias a facturar se ponen en tres arreglos (posición de la instancia,
+    día desde 1970, horas) y los totales salen de reducciones con bincount en
+    lugar de recorrer los objetos uno por uno.
+
+    Recibe los mismos grupos (nit, instancias) que arma FacturacionService y
+    devuelve las mismas estructuras que su motor en Python.
+
+    Las columnas se reutilizan entre llamadas mientras no cambien las
+    instancias ni sus acumulados (version_diarios); el vector de costos se
+    arma en cada llamada porque los precios pueden cambiar.
+    """
+
+    def __init__(self):
+        if not NUMPY_DISPONIBLE:
+            raise ImportError("El motor vectorizado necesita NumPy (pip install numpy)")
+        self._cache = None  # (firma, columnas)
+
+    def _columnas(self, grupos):
+        """Arreglos por instancia (cliente, configuración) y por acumulado diario"""
+        instancias = [instancia for _, grupo in grupos for instancia in grupo]
+        firma = [(id(instancia), instancia.version_diarios) for instancia in instancias]
+        cache = self._cache
+        if cache is not None and cache[0] == firma:
+            return cache[1]
+
+        clientes = np.repeat(np.arange(len(grupos)), [len(grupo) for _, grupo in grupos])
+
+        posiciones = {}
+        configuracion_de = np.fromiter(
+            (posiciones.setdefault(instancia.id_configuracion, len(posiciones)) for instancia in instancias),
+            dtype=np.int64, count=len(instancias)
+        )
+
+        diarios = [instancia.diarios for instancia in instancias]
+        conteos = np.fromiter((len(d) for d in diarios), dtype=np.int64, count=len(diarios))
+        total = int(conteos.sum())
+        posicion_instancia = np.repeat(np.arange(len(instancias)), conteos)
+        dias = np.fromiter(chain.from_iterable(diarios), dtype=np.int64, count=total)
+        horas = np.fromiter(chain.from_iterable(d.values() for d in diarios), dtype=np.float64, count=total)
+
+        columnas = (instancias, clientes, configuracion_de, posiciones, posicion_instancia, dias, horas)
+        self._cache = (firma, columnas)
+        return columnas
+
+    def _costos(self, db, posiciones):
+        """Vector de costo por hora, una entrada por configuración usada"""
+        costos = np.zeros(len(posiciones), dtype=np.float64)
+        for id_configuracion, posicion in posiciones.items():
+            configuracion = db['configuraciones'].buscar(id_configuracion)
+            # Configuración inexistente: costo 0, la instancia no se factura
+            if configuracion:
+                costos[posicion] = configuracion.calcular_costo_hora(db['recursos'])
+        return costos
+
+    def _totales(self, db, grupos, dia_desde, dia_hasta):
+        """Horas y monto del período por instancia, con los arreglos que los produjeron"""
+        instancias, clientes, configuracion_de, posiciones, posicion_instancia, dias, horas = \
+            self._columnas(grupos)
+        costos = self._costos(db, posiciones)
+        en_periodo = (dias >= dia_desde) & (dias <= dia_hasta)
+        tiempos = np.bincount(posicion_instancia[en_periodo], weights=horas[en_periodo],
+                              minlength=len(instancias))
+        montos = tiempos * costos[configuracion_de] if len(instancias) else tiempos
+        return instancias, clientes, configuracion_de, posiciones, tiempos, montos
+
+    def detalles_por_cliente(self, db, grupos, dia_desde, dia_hasta):
+        """[(nit, [(id_instancia, tiempo_total, monto)])] en el orden de `grupos`"""
+        instancias, clientes, _, _, tiempos, montos = self._totales(db, grupos, dia_desde, dia_hasta)
+        resultado = [(nit_cliente, []) for nit_cliente, _ in grupos]
+        for i in np.flatnonzero(montos > 0):
+            resultado[clientes[i]][1].append((instancias[i].id, float(tiempos[i]), float(montos[i])))
+        return resultado
+
+    def cargos_por_configuracion(self, db, grupos, dia_desde, dia_hasta):
+        """{id_configuracion: [monto, horas, ids de instancias]} de lo facturable en el período"""
+        instancias, _, configuracion_de, posiciones, tiempos, montos = \
+            self._totales(db, grupos, dia_desde, dia_hasta)
+        facturadas = montos > 0
+        montos_configuracion = np.bincount(configuracion_de[facturadas], weights=montos[facturadas],
+                                           minlength=len(posiciones))
+        tiempos_configuracion = np.bincount(configuracion_de[facturadas], weights=tiempos[facturadas],
+                                            minlength=len(posiciones))
+
+        por_configuracion = {}
+        ids_por_posicion = {}
+        for i in np.flatnonzero(facturadas):
+            ids_por_posicion.setdefault(configuracion_de[i], set()).add(instancias[i].id)
+        for id_configuracion, posicion in posiciones.items():
+            if posicion in ids_por_posicion:
+                por_configuracion[id_configuracion] = [float(montos_configuracion[posicion]),
+                                                       float(tiempos_configuracion[posicion]),
+                                                       ids_por_posicion[posicion]]
+        return por_configuracion
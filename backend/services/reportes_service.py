@@ -275,15 +275,15 @@ class ReportePDFService:
 
     def _obtener_cliente(self, db, nit_cliente):
         """Obtener cliente por NIT"""
-        return next((c for c in db['clientes'] if c.nit == nit_cliente), None)
+        return db['clientes'].buscar(nit_cliente)
 
     def _obtener_instancia(self, db, id_instancia):
         """Obtener instancia por ID"""
-        return next((i for i in db['instancias'] if i.id == id_instancia), None)
+        return db['instancias'].buscar(id_instancia)
 
     def _obtener_configuracion(self, db, id_configuracion):
         """Obtener configuración por ID"""
-        return next((c for c in db['configuraciones'] if c.id == id_configuracion), None)
+        return db['configuraciones'].buscar(id_configuracion)
 
     def _generar_desglose_recursos(self, factura, db):
         """Generar desglose REAL de recursos utilizados en la factura"""
@@ -303,15 +303,9 @@ class ReportePDFService:
             # Calcular el tiempo total de esta instancia en el período facturado
             tiempo_instancia = detalle.tiempo_total
 
-            # Procesar cada recurso de la configuración
-            for recurso_config in configuracion.recursos:
-                recurso = self._obtener_recurso(db, recurso_config.id_recurso)
-                if not recurso:
-                    continue
-
-                # Calcular cantidad y costo para este recurso
-                cantidad = recurso_config.cantidad
-                costo_por_hora = recurso.valor_x_hora * cantidad
+            # Procesar cada recurso de la configuración (desglose memoizado)
+            for recurso, cantidad, costo_por_hora in configuracion.desglose_costo_hora(db['recursos']):
+                # Calcular costo para este recurso
                 costo_total = costo_por_hora * tiempo_instancia
 
                 # Acumular en el diccionario
@@ -347,4 +341,4 @@ class ReportePDFService:
 
     def _obtener_recurso(self, db, id_recurso):
         """Obtener recurso por ID"""
-        return next((r for r in db['recursos'] if r.id == id_recurso), None)
\ No newline at end of file
+        return db['recursos'].buscar(id_recurso)
\ No newline at end of file
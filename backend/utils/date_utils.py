@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 import re
 
+EPOCH = datetime(1970, 1, 1)
+
 
 def parsear_fecha(fecha_str):
     """Convertir string dd/mm/yyyy a objeto datetime"""
@@ -59,4 +61,18 @@ def obtener_mes_anio_desde_fecha(fecha_str):
     fecha = parsear_fecha(fecha_str)
     if fecha:
         return fecha.strftime('%m/%Y')
-    return None
\ No newline at end of file
+    return None
+
+
+def fecha_hora_a_minutos(fecha_hora_str):
+    """Convertir 'dd/mm/yyyy hh:mi' (o solo 'dd/mm/yyyy') a minutos desde 1970"""
+    try:
+        fecha = datetime.strptime(fecha_hora_str, '%d/%m/%Y %H:%M')
+    except ValueError:
+        fecha = datetime.strptime(fecha_hora_str, '%d/%m/%Y')
+    return int((fecha - EPOCH).total_seconds()) // 60
+
+
+def minutos_a_fecha_hora(minutos):
+    """Convertir minutos desde 1970 a string 'dd/mm/yyyy hh:mi'"""
+    return (EPOCH + timedelta(minutes=minutos)).strftime('%d/%m/%Y %H:%M')